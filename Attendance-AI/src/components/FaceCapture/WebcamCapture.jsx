@@ -2,14 +2,19 @@
 import { useState, useRef, useEffect } from 'react';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/card';
-import { Camera, CheckCircle, XCircle, Loader2, AlertCircle } from 'lucide-react';
+import { Camera, CheckCircle, XCircle, Loader2, AlertCircle, Radio } from 'lucide-react';
 import { useToast } from '@/hooks/use-toast';
 
-const WebcamCapture = ({ onCapture, courseId, isRecognizing = false }) => {
+// Live mode sends downscaled frames; the server only needs the faces
+const LIVE_FRAME_WIDTH = 640;
+
+const WebcamCapture = ({ onCapture, courseId, isRecognizing = false, liveStreamUrl, onStreamEvent }) => {
   const videoRef = useRef(null);
   const canvasRef = useRef(null);
   const streamRef = useRef(null);
+  const socketRef = useRef(null);
   const [isStreaming, setIsStreaming] = useState(false);
+  const [isLive, setIsLive] = useState(false);
   const [hasCamera, setHasCamera] = useState(true);
   const [error, setError] = useState(null);
   const { toast } = useToast();
@@ -20,6 +25,7 @@ const WebcamCapture = ({ onCapture, courseId, isRecognizing = false }) => {
       startCamera();
     }
     return () => {
+      stopLive();
       stopCamera();
     };
   }, [courseId]);
@@ -64,16 +70,17 @@ const WebcamCapture = ({ onCapture, courseId, isRecognizing = false }) => {
     }
   };
 
-  const captureImage = () => {
+  const captureImage = (maxWidth = null, quality = 0.95) => {
     if (!videoRef.current || !canvasRef.current) return null;
 
     const video = videoRef.current;
     const canvas = canvasRef.current;
     const context = canvas.getContext('2d');
 
-    // Set canvas size to match video
-    canvas.width = video.videoWidth;
-    canvas.height = video.videoHeight;
+    // Set canvas size to match video (optionally downscaled)
+    const scale = maxWidth && video.videoWidth > maxWidth ? maxWidth / video.videoWidth : 1;
+    canvas.width = Math.round(video.videoWidth * scale);
+    canvas.height = Math.round(video.videoHeight * scale);
 
     // Draw video frame to canvas
     context.drawImage(video, 0, 0, canvas.width, canvas.height);
@@ -82,10 +89,50 @@ const WebcamCapture = ({ onCapture, courseId, isRecognizing = false }) => {
     return new Promise((resolve) => {
       canvas.toBlob((blob) => {
         resolve(blob);
-      }, 'image/jpeg', 0.95);
+      }, 'image/jpeg', quality);
     });
   };
 
+  // ----------------------------
+  // Live recognition over WebSocket: one frame in flight at a time,
+  // the next frame is sent when the server acknowledges the previous one
+  // ----------------------------
+  const sendLiveFrame = async () => {
+    const socket = socketRef.current;
+    if (!socket || socket.readyState !== WebSocket.OPEN) return;
+    const blob = await captureImage(LIVE_FRAME_WIDTH, 0.8);
+    if (blob) socket.send(blob);
+  };
+
+  const startLive = () => {
+    if (!liveStreamUrl || socketRef.current) return;
+    const socket = new WebSocket(liveStreamUrl);
+    socketRef.current = socket;
+
+    socket.onmessage = (message) => {
+      const event = JSON.parse(message.data);
+      if (event.type === 'ready' || event.type === 'frame' || event.type === 'error') {
+        sendLiveFrame();
+      } else if (event.type === 'busy') {
+        setTimeout(sendLiveFrame, 500);
+      }
+      if (onStreamEvent) onStreamEvent(event);
+    };
+    socket.onclose = () => {
+      socketRef.current = null;
+      setIsLive(false);
+    };
+    setIsLive(true);
+  };
+
+  const stopLive = () => {
+    if (socketRef.current) {
+      socketRef.current.close();
+      socketRef.current = null;
+    }
+    setIsLive(false);
+  };
+
   const handleCapture = async () => {
     try {
       console.log('[WebcamCapture] Capture button clicked');
@@ -186,7 +233,7 @@ const WebcamCapture = ({ onCapture, courseId, isRecognizing = false }) => {
         <div className="flex items-center justify-center gap-4">
           <Button
             onClick={handleCapture}
-            disabled={!isStreaming || isRecognizing}
+            disabled={!isStreaming || isRecognizing || isLive}
             size="lg"
             className="min-w-[200px]"
           >
@@ -203,8 +250,19 @@ const WebcamCapture = ({ onCapture, courseId, isRecognizing = false }) => {
             )}
           </Button>
           
+          {liveStreamUrl && isStreaming && (
+            <Button
+              onClick={isLive ? stopLive : startLive}
+              variant={isLive ? 'destructive' : 'secondary'}
+              size="lg"
+            >
+              <Radio className="h-5 w-5 mr-2" />
+              {isLive ? 'Stop Live' : 'Live Recognition'}
+            </Button>
+          )}
+
           {isStreaming && (
-            <Button onClick={stopCamera} variant="outline" size="lg">
+            <Button onClick={() => { stopLive(); stopCamera(); }} variant="outline" size="lg">
               Stop Camera
             </Button>
           )}
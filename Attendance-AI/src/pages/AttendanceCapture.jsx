@@ -21,6 +21,7 @@ const AttendanceCapture = () => {
   const [selectedCourseId, setSelectedCourseId] = useState(null);
   const [isRecognizing, setIsRecognizing] = useState(false);
   const [lastResult, setLastResult] = useState(null);
+  const [liveRecognized, setLiveRecognized] = useState([]);
   const [loading, setLoading] = useState(true);
   const navigate = useNavigate();
   const { toast } = useToast();
@@ -158,6 +159,23 @@ const AttendanceCapture = () => {
     }
   };
 
+  // Live mode: the server pushes an event the first time each face is resolved
+  const liveStreamUrl = selectedCourseId
+    ? `ws://localhost:8000/face/stream?token=${encodeURIComponent(localStorage.getItem('token') || '')}&course_id=${selectedCourseId}`
+    : null;
+
+  const handleStreamEvent = (event) => {
+    if (event.type === 'recognized') {
+      setLiveRecognized((previous) =>
+        previous.some((entry) => entry.student.id === event.student.id) ? previous : [event, ...previous]
+      );
+      toast({
+        title: '✅ Attendance Marked',
+        description: `${event.student.name} - ${(event.confidence * 100).toFixed(1)}% confidence`,
+      });
+    }
+  };
+
   if (loading) {
     return (
       <div className="min-h-screen bg-gradient-to-br from-slate-50 via-blue-50/30 to-indigo-50/50 flex items-center justify-center">
@@ -247,8 +265,38 @@ const AttendanceCapture = () => {
               onCapture={handleFaceCapture}
               courseId={selectedCourseId}
               isRecognizing={isRecognizing}
+              liveStreamUrl={liveStreamUrl}
+              onStreamEvent={handleStreamEvent}
             />
 
+            {/* Live Recognition Results */}
+            {liveRecognized.length > 0 && (
+              <Card className="mt-6">
+                <CardHeader>
+                  <CardTitle className="flex items-center gap-2">
+                    <CheckCircle className="h-5 w-5 text-emerald-600" />
+                    Recognized Live ({liveRecognized.length})
+                  </CardTitle>
+                </CardHeader>
+                <CardContent className="space-y-2">
+                  {liveRecognized.map((entry) => (
+                    <div
+                      key={entry.student.id}
+                      className="flex items-center justify-between p-3 bg-emerald-50 rounded-lg border border-emerald-200"
+                    >
+                      <div>
+                        <p className="font-semibold text-emerald-900">{entry.student.name}</p>
+                        <p className="text-sm text-emerald-700">{entry.student.email}</p>
+                      </div>
+                      <p className="text-lg font-bold text-emerald-700">
+                        {(entry.confidence * 100).toFixed(1)}%
+                      </p>
+                    </div>
+                  ))}
+                </CardContent>
+              </Card>
+            )}
+
             {/* Last Result */}
             {lastResult && (
               <Card className="mt-6">
@@ -0,0 +1,164 @@
+import numpy as np
+from app.ai.matcher import normalize, top_k
+from app.ai.quantization import approx_similarities, rescored_candidates
+
+
+# ------------------------------------------------------------
+# IVF (INVERTED FILE) APPROXIMATE NEAREST-NEIGHBOUR INDEX
+# ------------------------------------------------------------
+# Embeddings are clustered around `nlist` centroids with spherical k-means.
+# A probe is only compared against the students in the `nprobe` clusters
+# whose centroids are closest to it, so a search touches roughly
+# N * nprobe / nlist vectors instead of all N.
+def train_centroids(vectors: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means over normalized vectors; returns (nlist, dim) centroids."""
+    rng = np.random.default_rng(seed)
+    nlist = max(1, min(nlist, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = vectors[assignment == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                # Re-seed empty clusters so no list stays unused
+                centroids[c] = vectors[rng.integers(len(vectors))]
+        centroids = normalize(centroids)
+
+    return centroids
+
+
+class IVFIndex:
+    """
+    Approximate search index with the same interface as FaceMatcher:
+    add / remove / search / state / from_state.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, centroids: np.ndarray, nprobe: int = 8):
+        self.centroids = normalize(centroids)
+        self.nprobe = nprobe
+        self.trained_size = 0
+        dim = self.centroids.shape[1]
+        self.list_ids = [np.empty(0, dtype=np.int64) for _ in range(len(self.centroids))]
+        self.list_vectors = [np.empty((0, dim), dtype=np.float32) for _ in range(len(self.centroids))]
+        self.list_of = {}  # student_id -> list number
+        # Set when loaded from a file: matrix (and codes, if quantized) hold
+        # every list back to back, list c occupying rows bounds[c]:bounds[c + 1]
+        self.codes = self.scales = self.matrix = self.bounds = None
+
+    @classmethod
+    def build(cls, student_ids, embeddings, nlist: int = None, nprobe: int = 8) -> "IVFIndex":
+        """Train centroids on the given gallery and insert every vector."""
+        vectors = normalize(np.vstack(embeddings))
+        if nlist is None:
+            nlist = int(np.sqrt(len(vectors)))
+        index = cls(train_centroids(vectors, nlist), nprobe=nprobe)
+        index.trained_size = len(vectors)
+
+        assignment = np.argmax(vectors @ index.centroids.T, axis=1)
+        student_ids = np.asarray(student_ids, dtype=np.int64)
+        for c in range(len(index.centroids)):
+            members = assignment == c
+            index.list_ids[c] = student_ids[members]
+            index.list_vectors[c] = vectors[members]
+        index.list_of = {int(s): int(c) for s, c in zip(student_ids, assignment)}
+        return index
+
+    def __len__(self):
+        return len(self.list_of)
+
+    def __contains__(self, student_id):
+        return int(student_id) in self.list_of
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    # ----------------------------
+    # Incremental updates
+    # ----------------------------
+    def add(self, student_id: int, embedding: np.ndarray):
+        """Insert a student, replacing any vector already stored for them."""
+        self.remove(student_id)
+        vector = normalize(embedding)
+        c = int(np.argmax(self.centroids @ vector))
+        self.list_ids[c] = np.append(self.list_ids[c], np.int64(student_id))
+        self.list_vectors[c] = np.vstack([self.list_vectors[c], vector[np.newaxis, :]])
+        self.list_of[int(student_id)] = c
+        self.codes = None  # searched at full precision until saved again
+
+    def remove(self, student_id: int):
+        c = self.list_of.pop(int(student_id), None)
+        if c is None:
+            return
+        keep = self.list_ids[c] != student_id
+        self.list_ids[c] = self.list_ids[c][keep]
+        self.list_vectors[c] = self.list_vectors[c][keep]
+        self.codes = None
+
+    def vectors(self):
+        """All (student_ids, normalized matrix) currently stored, e.g. for retraining."""
+        return np.concatenate(self.list_ids), np.vstack(self.list_vectors)
+
+    # ----------------------------
+    # Search
+    # ----------------------------
+    def search(self, probe: np.ndarray, k: int = 5, nprobe: int = None) -> list[tuple[int, float]]:
+        """
+        Return the k closest students among the `nprobe` nearest clusters.
+        Passing nprobe=index.nlist scans every list and is exact.
+        """
+        if not len(self):
+            return []
+        probe = normalize(probe)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        lists = np.argpartition(-(self.centroids @ probe), nprobe - 1)[:nprobe]
+
+        ids = np.concatenate([self.list_ids[c] for c in lists])
+        if not len(ids):
+            return []
+        if self.codes is not None:
+            rows = np.concatenate([np.arange(self.bounds[c], self.bounds[c + 1]) for c in lists])
+            scales = self.scales[rows] if self.scales is not None else None
+            similarities = approx_similarities(self.codes[rows], scales, probe)
+            best, distances = rescored_candidates(similarities, self.matrix, probe, k, rows=rows)
+            return top_k(ids[best], distances, k)
+        distances = np.concatenate([1 - self.list_vectors[c] @ probe for c in lists])
+        return top_k(ids, distances, k)
+
+    # ----------------------------
+    # Persistence
+    # ----------------------------
+    def state(self) -> dict:
+        sizes = np.array([len(ids) for ids in self.list_ids], dtype=np.int64)
+        return {
+            "centroids": self.centroids,
+            "list_sizes": sizes,
+            "student_ids": np.concatenate(self.list_ids),
+            "matrix": np.vstack(self.list_vectors),
+            "nprobe": np.int64(self.nprobe),
+            "trained_size": np.int64(self.trained_size),
+        }
+
+    @classmethod
+    def from_state(cls, state) -> "IVFIndex":
+        """Rebuild from saved arrays; memory-mapped arrays are used in place, not copied."""
+        index = cls(state["centroids"], nprobe=int(state["nprobe"]))
+        index.trained_size = int(state["trained_size"])
+        bounds = np.concatenate([[0], np.cumsum(state["list_sizes"])])
+        student_ids = np.asarray(state["student_ids"], dtype=np.int64)
+        matrix = np.asarray(state["matrix"], dtype=np.float32)
+        for c in range(index.nlist):
+            start, end = bounds[c], bounds[c + 1]
+            index.list_ids[c] = student_ids[start:end]
+            index.list_vectors[c] = matrix[start:end]
+            for student_id in index.list_ids[c]:
+                index.list_of[int(student_id)] = c
+        index.matrix, index.bounds = matrix, bounds
+        if "codes" in state:
+            index.codes, index.scales = state["codes"], state.get("scales")
+        return index
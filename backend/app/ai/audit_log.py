@@ -0,0 +1,231 @@
+from collections import Counter, deque
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from app.database import SessionLocal
+from app.models import AttendanceLogs
+import json
+import os
+import threading
+import time
+
+# ------------------------------------------------------------
+# AUDIT LOG CONFIGURATION
+# ------------------------------------------------------------
+# Entries held in memory at most; beyond this new entries are dropped (and counted)
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+# Entries written per INSERT, and the longest an entry waits to be written
+AUDIT_FLUSH_SIZE = int(os.getenv("AUDIT_FLUSH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "2"))
+# Once the queue is half full, only 1 in this many successful matches is kept
+# (they are already in the attendance table); rejections are always kept
+AUDIT_SAMPLE_EVERY = int(os.getenv("AUDIT_SAMPLE_EVERY", "10"))
+
+RECOGNIZED = "Face recognized"
+FAILED = "Recognition failed"
+DROPPED = "Audit entries dropped"
+
+
+# ------------------------------------------------------------
+# BUFFERED WRITER
+# ------------------------------------------------------------
+class AuditLog:
+    """
+    Records every recognition attempt into attendance_logs without a
+    database round-trip on the request path: record() only appends to an
+    in-memory queue, and a background thread writes the queue out as
+    multi-row INSERTs every AUDIT_FLUSH_SIZE entries or AUDIT_FLUSH_INTERVAL
+    seconds, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        max_size: int = AUDIT_QUEUE_SIZE,
+        flush_size: int = AUDIT_FLUSH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL,
+        sample_every: int = AUDIT_SAMPLE_EVERY,
+    ):
+        self.max_size = max_size
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval
+        self.sample_every = max(1, sample_every)
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._sampled = 0
+
+        # Metrics
+        self.counts = Counter()  # recorded, written, sampled_out, dropped, rejected, flushes, failed_flushes
+        self._unreported_drops = 0
+        self.last_error = None
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Write out everything still queued, then stop the writer thread."""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join()
+        self._thread = None
+
+    # ----------------------------
+    # Hot path
+    # ----------------------------
+    def record(
+        self,
+        action: str,
+        source: str,
+        student_id: int = None,
+        course_id: int = None,
+        distance: float = None,
+        latency_ms: float = None,
+        reason: str = None,
+    ):
+        """
+        Queue one recognition attempt. Never blocks on the database: under
+        pressure successful matches are sampled, and a full queue drops the
+        entry (the count is written to the log once there is room).
+        """
+        with self._cond:
+            if action == RECOGNIZED and len(self._queue) >= self.max_size // 2:
+                self._sampled += 1
+                if self._sampled % self.sample_every:
+                    self.counts["sampled_out"] += 1
+                    return
+            if len(self._queue) >= self.max_size:
+                self.counts["dropped"] += 1
+                self._unreported_drops += 1
+                return
+
+            note = {"source": source}
+            if distance is not None:
+                note["distance"] = round(float(distance), 4)
+            if latency_ms is not None:
+                note["latency_ms"] = round(latency_ms, 1)
+            if reason:
+                note["reason"] = reason
+            self._queue.append({
+                "student_id": student_id,
+                "course_id": course_id,
+                "action": action,
+                "timestamp": datetime.utcnow(),
+                "confidence_score": round((1 - distance) * 100, 2) if distance is not None else None,
+                "system_note": json.dumps(note),
+            })
+            self.counts["recorded"] += 1
+            if len(self._queue) == self.flush_size:
+                self._cond.notify()
+
+    # ----------------------------
+    # Writer thread
+    # ----------------------------
+    def _run(self):
+        failing = False
+        while True:
+            with self._cond:
+                # After a failed write, wait out the interval before retrying
+                if not self._stopping and (failing or len(self._queue) < self.flush_size):
+                    self._cond.wait(self.flush_interval)
+                stopping = self._stopping
+            written = self._flush()
+            while written >= self.flush_size:  # catch up after a burst
+                written = self._flush()
+            failing = written < 0
+            if stopping:
+                self._flush_all()
+                return
+
+    def _insert(self, rows: list):
+        db = SessionLocal()
+        try:
+            db.execute(insert(AttendanceLogs).values(rows))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _flush(self) -> int:
+        """Write one batch; returns how many entries were written, or -1 on failure."""
+        with self._cond:
+            rows = [self._queue.popleft() for _ in range(min(self.flush_size, len(self._queue)))]
+            drops, self._unreported_drops = self._unreported_drops, 0
+        summary = None
+        if drops:
+            summary = {
+                "student_id": None,
+                "course_id": None,
+                "action": DROPPED,
+                "timestamp": datetime.utcnow(),
+                "confidence_score": None,
+                "system_note": json.dumps({"dropped": drops, "reason": "audit queue full"}),
+            }
+            rows.append(summary)
+        if not rows:
+            return 0
+
+        written, pending, chunk = 0, [rows], []
+        try:
+            while pending:
+                chunk = pending.pop()
+                try:
+                    self._insert(chunk)
+                    written += len(chunk)
+                except IntegrityError as e:
+                    # Retrying cannot fix a row the database rejects (e.g. an unknown
+                    # course): bisect the batch and drop only the offending rows
+                    self.last_error = str(e.orig)
+                    if len(chunk) == 1:
+                        self.counts["rejected"] += 1
+                        print("❌ Audit log entry rejected by the database:", e.orig)
+                    else:
+                        middle = len(chunk) // 2
+                        pending += [chunk[middle:], chunk[:middle]]
+                chunk = []
+        except Exception as e:
+            self.counts["failed_flushes"] += 1
+            self.last_error = str(e)
+            print("❌ Could not write audit log entries:", e)
+            # Put the unwritten ones back for the next attempt, as far as the queue has room
+            unwritten = chunk + [row for part in reversed(pending) for row in part]
+            if summary is not None and any(row is summary for row in unwritten):
+                unwritten = [row for row in unwritten if row is not summary]
+            else:
+                drops = 0
+            with self._cond:
+                room = max(0, self.max_size - len(self._queue))
+                self._queue.extendleft(reversed(unwritten[:room]))
+                lost = max(0, len(unwritten) - room)
+                self.counts["dropped"] += lost
+                self._unreported_drops += drops + lost
+            self.counts["written"] += written
+            return -1
+
+        self.counts["written"] += written
+        self.counts["flushes"] += 1
+        return written
+
+    def _flush_all(self):
+        for _ in range(3):  # give a failing database a couple more chances
+            while (self._queue or self._unreported_drops) and self._flush() >= 0:
+                pass
+            if not self._queue:
+                return
+            time.sleep(1)
+        print(f"⚠️ {len(self._queue)} audit log entries could not be written before shutdown")
+
+    def stats(self) -> dict:
+        return {**self.counts, "queued": len(self._queue), "last_error": self.last_error}
+
+
+# One writer per worker process
+audit_log = AuditLog()
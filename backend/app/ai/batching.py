@@ -0,0 +1,90 @@
+from collections import Counter, deque
+import asyncio
+import numpy as np
+import os
+import time
+
+# ------------------------------------------------------------
+# BATCHING CONFIGURATION
+# ------------------------------------------------------------
+# Concurrent probes are collected for up to this many milliseconds...
+FACE_BATCH_WINDOW_MS = float(os.getenv("FACE_BATCH_WINDOW_MS", "10"))
+# ...or until this many are waiting, then embedded in one forward pass
+FACE_BATCH_MAX_SIZE = int(os.getenv("FACE_BATCH_MAX_SIZE", "32"))
+
+
+# ------------------------------------------------------------
+# MICRO-BATCHER
+# ------------------------------------------------------------
+class MicroBatcher:
+    """
+    Groups items submitted concurrently from many requests into one call of
+    `run_batch(items) -> results`, then hands each caller its own result.
+    A result that is an Exception is raised in that caller only.
+    """
+
+    def __init__(self, run_batch, window_ms: float = FACE_BATCH_WINDOW_MS, max_size: int = FACE_BATCH_MAX_SIZE):
+        self.run_batch = run_batch
+        self.window = window_ms / 1000
+        self.max_size = max(1, max_size)
+        self._waiting = []  # (item, future, enqueued_at)
+        self._timer = None
+
+        # Metrics
+        self.batch_sizes = Counter()
+        self.queue_waits_ms = deque(maxlen=1000)
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiting.append((item, future, time.perf_counter()))
+
+        if len(self._waiting) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._waiting = self._waiting, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch):
+        started = time.perf_counter()
+        self.batch_sizes[len(batch)] += 1
+        self.queue_waits_ms.extend((started - enqueued) * 1000 for _, _, enqueued in batch)
+
+        try:
+            results = await self.run_batch([item for item, _, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, future, _), result in zip(batch, results):
+            if future.done():  # caller went away
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def metrics(self) -> dict:
+        batches = sum(self.batch_sizes.values())
+        items = sum(size * count for size, count in self.batch_sizes.items())
+        waits = np.array(self.queue_waits_ms) if self.queue_waits_ms else np.zeros(1)
+        return {
+            "batches": batches,
+            "items": items,
+            "mean_batch_size": round(items / batches, 2) if batches else 0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "queue_wait_ms": {
+                "p50": round(float(np.percentile(waits, 50)), 2),
+                "p95": round(float(np.percentile(waits, 95)), 2),
+                "max": round(float(waits.max()), 2),
+            },
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_size,
+        }
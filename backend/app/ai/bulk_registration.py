@@ -0,0 +1,178 @@
+from contextlib import contextmanager
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.ai.face_embeddings import add_face_images
+from app.ai.face_store import crop_path
+from app.ai.gallery import rebuild_index
+from app.models import Students
+import asyncio
+import os
+import re
+import zipfile
+
+# ------------------------------------------------------------
+# BULK REGISTRATION CONFIGURATION
+# ------------------------------------------------------------
+# Photos embedded together in one job / forward pass
+FACE_BULK_CHUNK_SIZE = int(os.getenv("FACE_BULK_CHUNK_SIZE", "16"))
+# Students written per database transaction
+FACE_BULK_COMMIT_SIZE = int(os.getenv("FACE_BULK_COMMIT_SIZE", "200"))
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def reg_key(reg_number: str) -> str:
+    """
+    Filename-safe form of a registration number, so "CS2021/001" matches
+    a photo named CS2021_001.jpg or CS2021-001.jpg.
+    """
+    return re.sub(r"[^A-Za-z0-9]+", "_", reg_number).strip("_").upper()
+
+
+# ------------------------------------------------------------
+# IMAGE SOURCES
+# ------------------------------------------------------------
+@contextmanager
+def open_images(source):
+    """
+    List the photos in a ZIP archive or directory as (name, reg_key, read)
+    triples. A photo belongs to the student named by its folder when it is
+    inside one (CS2021_001/front.jpg), otherwise by its file name
+    (CS2021_001.jpg). Files that are not images are listed with read=None.
+    A context manager: the archive is closed on exit, so only call `read`
+    inside the `with` block.
+    """
+    archive = None
+    if isinstance(source, str) and os.path.isdir(source):
+        names = sorted(
+            os.path.relpath(os.path.join(root, filename), source)
+            for root, _, filenames in os.walk(source)
+            for filename in filenames
+        )
+
+        def reader(name):
+            def read():
+                with open(os.path.join(source, name), "rb") as f:
+                    return f.read()
+            return read
+    elif zipfile.is_zipfile(source):
+        archive = zipfile.ZipFile(source)
+        names = [info.filename for info in archive.infolist() if not info.is_dir()]
+
+        def reader(name):
+            return lambda: archive.read(name)
+    else:
+        raise ValueError("Expected a ZIP archive or a directory of images")
+
+    images = []
+    for name in names:
+        parts = name.replace("\\", "/").split("/")
+        if parts[0] == "__MACOSX" or parts[-1].startswith("."):
+            continue
+        stem, ext = os.path.splitext(parts[-1])
+        key = reg_key(parts[-2] if len(parts) > 1 else stem)
+        images.append((name, key, reader(name) if ext.lower() in IMAGE_EXTENSIONS else None))
+    try:
+        yield images
+    finally:
+        if archive is not None:
+            archive.close()
+
+
+# ------------------------------------------------------------
+# BULK REGISTRATION
+# ------------------------------------------------------------
+def _write_batch(db: Session, batch: dict, replace: bool, written: set):
+    """Record one batch of students' crops and templates in a single transaction."""
+    image_paths = []
+    for student_id, images in batch.items():
+        # Replace a student's old photos only once, not again for later batches
+        add_face_images(db, student_id, images, replace=replace and student_id not in written)
+        written.add(student_id)
+        image_paths.append({"student_id": student_id, "image_path": crop_path(images[-1][0])})
+    db.bulk_update_mappings(Students, image_paths)
+    db.commit()
+
+
+async def bulk_register(db: Session, source, embed, concurrency: int, replace: bool = False):
+    """
+    Register every photo in `source` (ZIP or directory named by reg_number).
+
+    `embed(images) -> results` stores and embeds a chunk of encoded images,
+    returning (content_hash, embedding) or a ValueError per image; up to
+    `concurrency` chunks run at once. Students are committed in batches of
+    FACE_BULK_COMMIT_SIZE and the search index is rebuilt once at the end,
+    both in the threadpool so other requests keep being served meanwhile.
+
+    Yields progress events as dicts, ending with a summary that lists
+    every file that could not be registered and why.
+    """
+    with open_images(source) as images:
+        async for event in _register_images(db, images, embed, concurrency, replace):
+            yield event
+
+
+def _student_keys(db: Session) -> dict:
+    return {
+        reg_key(reg_number): student_id
+        for student_id, reg_number in db.query(Students.student_id, Students.reg_number)
+    }
+
+
+async def _register_images(db: Session, images: list, embed, concurrency: int, replace: bool):
+    students = await run_in_threadpool(_student_keys, db)
+
+    errors, todo = [], []
+    for name, key, read in images:
+        if read is None:
+            errors.append({"file": name, "error": "Not an image file"})
+        elif key not in students:
+            errors.append({"file": name, "error": "No student with this reg_number"})
+        else:
+            todo.append((name, key, read))
+
+    total, done = len(images), len(errors)
+    yield {"type": "start", "total": total, "to_embed": len(todo)}
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_chunk(chunk):
+        async with semaphore:
+            try:
+                # Reading decompresses ZIP members, so off the event loop too
+                encoded = await run_in_threadpool(lambda: [read() for _, _, read in chunk])
+                results = await embed(encoded)
+            except Exception as e:
+                results = [e] * len(chunk)
+            return chunk, results
+
+    chunks = [todo[i:i + FACE_BULK_CHUNK_SIZE] for i in range(0, len(todo), FACE_BULK_CHUNK_SIZE)]
+    batch, written = {}, set()
+    for finished in asyncio.as_completed([run_chunk(chunk) for chunk in chunks]):
+        chunk, results = await finished
+        for (name, key, _), result in zip(chunk, results):
+            if isinstance(result, Exception):
+                errors.append({"file": name, "error": str(result)})
+                continue
+            batch.setdefault(students[key], []).append(result)
+
+        done += len(chunk)
+        if len(batch) >= FACE_BULK_COMMIT_SIZE:
+            await run_in_threadpool(_write_batch, db, batch, replace, written)
+            batch = {}
+        yield {"type": "progress", "done": done, "total": total, "failed": len(errors)}
+
+    if batch:
+        await run_in_threadpool(_write_batch, db, batch, replace, written)
+
+    # One index rebuild instead of an update per student; the new generation
+    # also makes every worker reload its course galleries
+    await run_in_threadpool(rebuild_index, db)
+
+    yield {
+        "type": "summary",
+        "files": total,
+        "registered_students": len(written),
+        "failed": len(errors),
+        "errors": errors,
+    }
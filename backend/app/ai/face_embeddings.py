@@ -0,0 +1,139 @@
+from sqlalchemy.orm import Session
+from app.ai.face_model import FACE_MODEL, FACE_MODEL_VERSION, get_face_model
+from app.ai.matcher import normalize
+from app.models import FaceEmbeddings, FaceImages, StudentCourse
+import numpy as np
+import os
+
+# ------------------------------------------------------------
+# MATCHING CONFIGURATION
+# ------------------------------------------------------------
+# Cosine distance below which two faces are considered the same person
+MATCH_THRESHOLD = float(os.getenv("FACE_MATCH_THRESHOLD", "0.4"))
+# Reference photos kept per student; the oldest are dropped beyond this
+FACE_MAX_IMAGES = int(os.getenv("FACE_MAX_IMAGES", "10"))
+
+
+# ------------------------------------------------------------
+# EMBEDDING
+# ------------------------------------------------------------
+def compute_embedding(img, enforce_detection: bool = True) -> np.ndarray:
+    """
+    Detect the largest face in `img` (file path, encoded bytes or BGR array) and
+    return its embedding as a float32 vector.
+    """
+    return get_face_model().embed(img, enforce_detection=enforce_detection)
+
+
+def build_template(embeddings) -> np.ndarray:
+    """
+    Combine several embeddings of one student into a single template:
+    the normalized centroid of the normalized vectors. Matching stays one
+    comparison per student however many photos were enrolled.
+    """
+    return normalize(normalize(np.vstack(embeddings)).mean(axis=0))
+
+
+# ------------------------------------------------------------
+# STORAGE
+# ------------------------------------------------------------
+def save_embedding(db: Session, student_id: int, embedding: np.ndarray, image_count: int = 1) -> FaceEmbeddings:
+    """
+    Insert or replace the student's template embedding for the configured model.
+    The caller is responsible for committing.
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    record = (
+        db.query(FaceEmbeddings)
+        .filter(
+            FaceEmbeddings.student_id == student_id,
+            FaceEmbeddings.model_name == FACE_MODEL,
+            FaceEmbeddings.model_version == FACE_MODEL_VERSION,
+        )
+        .first()
+    )
+    if record is None:
+        record = FaceEmbeddings(
+            student_id=student_id,
+            model_name=FACE_MODEL,
+            model_version=FACE_MODEL_VERSION,
+        )
+        db.add(record)
+
+    record.dimensions = int(vector.shape[0])
+    record.embedding = vector.tobytes()
+    record.image_count = image_count
+    return record
+
+
+def _images_of(db: Session, student_id: int):
+    return db.query(FaceImages).filter(
+        FaceImages.student_id == student_id,
+        FaceImages.model_name == FACE_MODEL,
+        FaceImages.model_version == FACE_MODEL_VERSION,
+    )
+
+
+def add_face_images(db: Session, student_id: int, images: list[tuple[str, np.ndarray]], replace: bool = False):
+    """
+    Record new reference crops as (content_hash, embedding) pairs and rebuild
+    the student's template. A crop already on file for the configured model
+    is not stored twice. `replace=True` discards the crops already on file
+    first. The caller is responsible for committing.
+    """
+    if replace:
+        db.query(FaceImages).filter(FaceImages.student_id == student_id).delete(synchronize_session=False)
+        known = set()
+    else:
+        known = {crop_hash for (crop_hash,) in _images_of(db, student_id).with_entities(FaceImages.content_hash)}
+
+    for crop_hash, embedding in images:
+        if crop_hash in known:
+            continue
+        known.add(crop_hash)
+        db.add(FaceImages(
+            student_id=student_id,
+            content_hash=crop_hash,
+            model_name=FACE_MODEL,
+            model_version=FACE_MODEL_VERSION,
+            embedding=np.asarray(embedding, dtype=np.float32).tobytes(),
+        ))
+    db.flush()
+    return rebuild_template(db, student_id)
+
+
+def rebuild_template(db: Session, student_id: int):
+    """
+    Recompute the student's template from their newest FACE_MAX_IMAGES
+    crops, dropping older ones for every model. Returns the template, or
+    None if the student has no crops embedded with the configured model.
+    """
+    images = _images_of(db, student_id).order_by(FaceImages.created_at.desc(), FaceImages.image_id.desc()).all()
+    stale = [image.content_hash for image in images[FACE_MAX_IMAGES:]]
+    if stale:
+        db.query(FaceImages).filter(
+            FaceImages.student_id == student_id, FaceImages.content_hash.in_(stale)
+        ).delete(synchronize_session=False)
+    images = images[:FACE_MAX_IMAGES]
+    if not images:
+        return None
+
+    template = build_template([np.frombuffer(image.embedding, dtype=np.float32) for image in images])
+    save_embedding(db, student_id, template, image_count=len(images))
+    return template
+
+
+def load_embeddings(db: Session, course_id: int = None) -> list[tuple[int, np.ndarray]]:
+    """
+    Return (student_id, embedding) pairs stored for the configured model,
+    optionally limited to students enrolled in `course_id`.
+    """
+    query = db.query(FaceEmbeddings.student_id, FaceEmbeddings.embedding).filter(
+        FaceEmbeddings.model_name == FACE_MODEL,
+        FaceEmbeddings.model_version == FACE_MODEL_VERSION,
+    )
+    if course_id is not None:
+        query = query.join(
+            StudentCourse, StudentCourse.student_id == FaceEmbeddings.student_id
+        ).filter(StudentCourse.course_id == course_id)
+    return [(student_id, np.frombuffer(blob, dtype=np.float32)) for student_id, blob in query.all()]
@@ -0,0 +1,130 @@
+from deepface import DeepFace
+from deepface.modules import detection, preprocessing
+from app.ai.image_pipeline import load_image
+import numpy as np
+import os
+import threading
+
+# ------------------------------------------------------------
+# MODEL CONFIGURATION
+# ------------------------------------------------------------
+# Embeddings are only comparable when they come from the same model,
+# so every stored vector is tagged with the model name and version.
+FACE_MODEL = os.getenv("FACE_MODEL", "VGG-Face")
+FACE_MODEL_VERSION = os.getenv("FACE_MODEL_VERSION", "1")
+FACE_DETECTOR = os.getenv("FACE_DETECTOR", "opencv")
+
+
+# ------------------------------------------------------------
+# SHARED MODEL HANDLE
+# ------------------------------------------------------------
+def largest_face(faces: list[dict]) -> dict:
+    return max(faces, key=lambda f: f["facial_area"]["w"] * f["facial_area"]["h"])
+
+
+class FaceModel:
+    """
+    The recognition model and face detector, built once per process.
+    All recognition code paths embed through this handle.
+    """
+
+    def __init__(self, model_name: str = FACE_MODEL, detector_backend: str = FACE_DETECTOR):
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.model = DeepFace.build_model(model_name)
+        self.detector = None
+        if detector_backend != "skip":
+            self.detector = DeepFace.build_model(detector_backend, task="face_detector")
+        # DeepFace models declare (width, height); the resizer wants (height, width)
+        self.target_size = (self.model.input_shape[1], self.model.input_shape[0])
+
+    def detect(self, img, enforce_detection: bool = True) -> list[dict]:
+        """
+        Detect and align faces in `img` (file path, encoded bytes or BGR array).
+        Each result holds a BGR float crop under "face" and its "facial_area".
+
+        Same steps as DeepFace.extract_faces, but alignment works on a small
+        region around each face instead of a copy of the whole image padded
+        by 50% per side, which matters for large classroom photos.
+        """
+        img = load_image(img)
+        regions = self.detector.detect_faces(img) if self.detector else []
+        faces = []
+        for region in regions:
+            detected = detection.extract_face(
+                facial_area=region,
+                img=img,
+                align=True,
+                expand_percentage=0,
+                width_border=0,
+                height_border=0,
+            )
+            if detected.img.size == 0:
+                continue
+            faces.append({
+                "face": detected.img / 255,
+                "facial_area": {"x": int(region.x), "y": int(region.y), "w": int(region.w), "h": int(region.h)},
+                "confidence": detected.confidence,
+            })
+
+        if not faces:
+            if enforce_detection:
+                raise ValueError("Face could not be detected in the image")
+            # Fall back to the whole frame, as DeepFace does
+            height, width = img.shape[:2]
+            faces = [{"face": img / 255, "facial_area": {"x": 0, "y": 0, "w": width, "h": height}, "confidence": 0}]
+        return faces
+
+    def embed_faces(self, faces: list[np.ndarray]) -> np.ndarray:
+        """Embed already-cropped faces in one forward pass; returns (n, dim) float32."""
+        batch = np.concatenate([preprocessing.resize_image(face, self.target_size) for face in faces])
+        embeddings = np.asarray(self.model.forward(batch), dtype=np.float32)
+        return embeddings.reshape(len(faces), -1)
+
+    def embed(self, img, enforce_detection: bool = True) -> np.ndarray:
+        """Embed the largest face in `img`."""
+        faces = self.detect(img, enforce_detection=enforce_detection)
+        return self.embed_faces([largest_face(faces)["face"]])[0]
+
+    def embed_all(self, img, batch_size: int = 32) -> tuple[list[dict], np.ndarray]:
+        """
+        Detect every face in `img` and embed them in batches.
+        Returns the facial areas and an (n, dim) embedding matrix.
+        """
+        try:
+            faces = self.detect(img, enforce_detection=True)
+        except ValueError:  # no face in the image
+            return [], np.empty((0, 0), dtype=np.float32)
+
+        embeddings = np.vstack([
+            self.embed_faces([f["face"] for f in faces[start:start + batch_size]])
+            for start in range(0, len(faces), batch_size)
+        ])
+        return [f["facial_area"] for f in faces], embeddings
+
+    def warm_up(self):
+        """Run one inference so graph tracing and allocations happen before real traffic."""
+        dummy = np.zeros((224, 224, 3), dtype=np.uint8)
+        self.detect(dummy, enforce_detection=False)
+        # Trace both the single-face and the batched forward paths
+        self.embed_faces([dummy.astype(np.float32)])
+        self.embed_faces([dummy.astype(np.float32)] * 2)
+
+
+_face_model = None
+_lock = threading.Lock()
+
+
+def load_face_model() -> FaceModel:
+    """Build and warm up the shared model once; safe to call repeatedly."""
+    global _face_model
+    with _lock:
+        if _face_model is None:
+            model = FaceModel()
+            model.warm_up()
+            _face_model = model
+        return _face_model
+
+
+def get_face_model() -> FaceModel:
+    return _face_model or load_face_model()
@@ -1,89 +1,341 @@
-from deepface import DeepFace
+from app.ai.face_embeddings import MATCH_THRESHOLD
+from app.ai.face_model import FACE_MODEL, FACE_MODEL_VERSION, get_face_model
+from app.ai.inference_pool import embed_new_faces
+from app.ai.matcher import FaceMatcher
+from app.ai.tracking import FaceTracker
+from datetime import datetime, timedelta
+import argparse
+import base64
 import cv2
+import json
+import numpy as np
 import os
+import requests
+import sqlite3
+import threading
+import time
 import uuid
-from datetime import datetime
-from app.database import SessionLocal
-from app.models import Students, Attendance
+
+# Classroom kiosk: recognizes faces from a local camera against a cached
+# copy of the course gallery and queues attendance in a local SQLite file,
+# so recognition never waits on the network. A background thread pushes
+# queued events to the API in batches whenever it is reachable.
+#   KIOSK_EMAIL=lecturer@uni.edu KIOSK_PASSWORD=... python -m app.ai.face_recognition_service --course-id 3
 
 # ------------------------------------------------------------
-# DIRECTORY SETUP
+# KIOSK CONFIGURATION
 # ------------------------------------------------------------
-# Folders for known faces and captured images
-KNOWN_FACES_DIR = "images/faces"
-CAPTURED_DIR = "images/captured"
+KIOSK_API_URL = os.getenv("KIOSK_API_URL", "http://localhost:8000")
+# Lecturer account the kiosk signs in with
+KIOSK_EMAIL = os.getenv("KIOSK_EMAIL")
+KIOSK_PASSWORD = os.getenv("KIOSK_PASSWORD")
+KIOSK_COURSE_ID = int(os.getenv("KIOSK_COURSE_ID", "1"))
+KIOSK_CAMERA = int(os.getenv("KIOSK_CAMERA", "0"))
+# Local queue + cached gallery
+KIOSK_DB_PATH = os.getenv("KIOSK_DB_PATH", "kiosk.db")
+# Seconds between sync attempts, and most events sent per request
+KIOSK_SYNC_INTERVAL = float(os.getenv("KIOSK_SYNC_INTERVAL", "10"))
+KIOSK_SYNC_BATCH = int(os.getenv("KIOSK_SYNC_BATCH", "200"))
+# Seconds between gallery refreshes (new registrations, roster changes)
+KIOSK_GALLERY_REFRESH = float(os.getenv("KIOSK_GALLERY_REFRESH", "300"))
+# A student recognized again within this many seconds is not queued again
+KIOSK_REPEAT_AFTER = float(os.getenv("KIOSK_REPEAT_AFTER", "600"))
+# Failed embeddings of a face before it is left alone as unknown
+KIOSK_UNKNOWN_AFTER = int(os.getenv("KIOSK_UNKNOWN_AFTER", "3"))
+# Days synced events are kept locally before being pruned
+KIOSK_KEEP_DAYS = int(os.getenv("KIOSK_KEEP_DAYS", "7"))
+KIOSK_HTTP_TIMEOUT = float(os.getenv("KIOSK_HTTP_TIMEOUT", "5"))
 
-# Make sure the folders exist
-os.makedirs(KNOWN_FACES_DIR, exist_ok=True)
-os.makedirs(CAPTURED_DIR, exist_ok=True)
 
 # ------------------------------------------------------------
-# DATABASE CONNECTION
+# LOCAL DURABLE STORE
 # ------------------------------------------------------------
-db = SessionLocal()
+class LocalStore:
+    """
+    SQLite file holding the attendance event queue and the last gallery
+    fetched per course. Every event is committed before it is reported,
+    so a crash or power cut loses nothing that was shown on screen.
+    """
+
+    def __init__(self, path: str = KIOSK_DB_PATH):
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                event_id TEXT PRIMARY KEY,
+                student_id INTEGER NOT NULL,
+                course_id INTEGER NOT NULL,
+                seen_at TEXT NOT NULL,
+                distance REAL NOT NULL,
+                synced_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_events_pending ON events (seen_at) WHERE synced_at IS NULL;
+            CREATE TABLE IF NOT EXISTS galleries (
+                course_id INTEGER PRIMARY KEY,
+                etag TEXT,
+                payload TEXT NOT NULL,
+                fetched_at TEXT NOT NULL
+            );
+        """)
+
+    def enqueue(self, student_id: int, course_id: int, distance: float, seen_at: datetime = None) -> str:
+        event_id = str(uuid.uuid4())
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO events (event_id, student_id, course_id, seen_at, distance) VALUES (?, ?, ?, ?, ?)",
+                (event_id, student_id, course_id, (seen_at or datetime.now()).isoformat(), distance),
+            )
+        return event_id
+
+    def pending(self, limit: int = KIOSK_SYNC_BATCH) -> list[dict]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT event_id, student_id, course_id, seen_at, distance FROM events "
+                "WHERE synced_at IS NULL ORDER BY seen_at LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            {"event_id": e, "student_id": s, "course_id": c, "seen_at": t, "distance": d}
+            for e, s, c, t, d in rows
+        ]
+
+    def mark_synced(self, event_ids: list[str]):
+        now = datetime.now().isoformat()
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE events SET synced_at = ? WHERE event_id = ?", [(now, e) for e in event_ids]
+            )
+
+    def prune(self, keep_days: int = KIOSK_KEEP_DAYS):
+        cutoff = (datetime.now() - timedelta(days=keep_days)).isoformat()
+        with self.lock:
+            self.conn.execute("DELETE FROM events WHERE synced_at IS NOT NULL AND synced_at < ?", (cutoff,))
+
+    def counts(self) -> dict:
+        with self.lock:
+            pending, synced = self.conn.execute(
+                "SELECT COUNT(*) - COUNT(synced_at), COUNT(synced_at) FROM events"
+            ).fetchone()
+        return {"pending": pending, "synced": synced}
+
+    def save_gallery(self, course_id: int, etag: str, payload: dict):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO galleries (course_id, etag, payload, fetched_at) VALUES (?, ?, ?, ?)",
+                (course_id, etag, json.dumps(payload), datetime.now().isoformat()),
+            )
+
+    def load_gallery(self, course_id: int):
+        """Return (etag, payload) of the cached gallery, or (None, None)."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT etag, payload FROM galleries WHERE course_id = ?", (course_id,)
+            ).fetchone()
+        return (row[0], json.loads(row[1])) if row else (None, None)
+
 
 # ------------------------------------------------------------
-# FACE RECOGNITION LOGIC
+# API CLIENT
 # ------------------------------------------------------------
-def recognize_face():
-    """
-    Capture a face from webcam, compare it with known faces in the system,
-    and mark attendance automatically if a match is found.
-    """
+class ApiClient:
+    """Signs in as the kiosk's lecturer and signs in again when the token expires."""
+
+    def __init__(self, base_url: str = KIOSK_API_URL, email: str = KIOSK_EMAIL, password: str = KIOSK_PASSWORD):
+        self.base_url = base_url.rstrip("/")
+        self.email = email
+        self.password = password
+        self.session = requests.Session()
+        self.token = None
 
-    # Open camera (0 = default webcam)
-    cap = cv2.VideoCapture(0)
-    ret, frame = cap.read()
-
-    if not ret:
-        cap.release()
-        return {"status": "error", "message": "Unable to access camera"}
-
-    # Save captured frame temporarily
-    captured_path = os.path.join(CAPTURED_DIR, f"{uuid.uuid4()}.jpg")
-    cv2.imwrite(captured_path, frame)
-    cap.release()
-
-    try:
-        # Loop through known faces
-        for file in os.listdir(KNOWN_FACES_DIR):
-            known_path = os.path.join(KNOWN_FACES_DIR, file)
-
-            # Compare face with DeepFace
-            result = DeepFace.verify(
-                img1_path=captured_path,
-                img2_path=known_path,
-                model_name="VGG-Face",  # You can use "Facenet" or "ArcFace" too
-                enforce_detection=False
+    def _login(self):
+        response = self.session.post(
+            f"{self.base_url}/auth/login",
+            json={"email": self.email, "password": self.password},
+            timeout=KIOSK_HTTP_TIMEOUT,
+        )
+        response.raise_for_status()
+        self.token = response.json()["access_token"]
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Raises requests.RequestException when the API is unreachable or fails."""
+        for attempt in range(2):
+            if self.token is None:
+                self._login()
+            headers = {**kwargs.pop("headers", {}), "Authorization": f"Bearer {self.token}"}
+            response = self.session.request(
+                method, f"{self.base_url}{path}", headers=headers, timeout=KIOSK_HTTP_TIMEOUT, **kwargs
             )
+            if response.status_code != 401 or attempt:
+                response.raise_for_status()
+                return response
+            self.token = None  # expired; sign in again and retry once
+
+    def fetch_gallery(self, course_id: int, etag: str = None):
+        """Return (etag, payload), or (etag, None) when the cached copy is current."""
+        response = self.request(
+            "GET", f"/face/kiosk/gallery/{course_id}", headers={"If-None-Match": etag} if etag else {}
+        )
+        if response.status_code == 304:
+            return etag, None
+        return response.headers.get("ETag"), response.json()
+
+    def sync(self, events: list[dict]) -> dict:
+        return self.request("POST", "/face/kiosk/sync", json={"events": events}).json()
+
+
+# ------------------------------------------------------------
+# KIOSK
+# ------------------------------------------------------------
+class Kiosk:
+    def __init__(self, course_id: int, store: LocalStore, api: ApiClient):
+        self.course_id = course_id
+        self.store = store
+        self.api = api
+        self.matcher = FaceMatcher([], [])
+        self.names = {}
+        self.tracker = FaceTracker()
+        self.last_queued = {}  # student_id -> monotonic time it was last queued
+        self.online = False
+        self._stop = threading.Event()
+
+    # ----------------------------
+    # Gallery
+    # ----------------------------
+    def load_gallery(self) -> bool:
+        """Build the matcher from the cached gallery; works without network."""
+        _, payload = self.store.load_gallery(self.course_id)
+        if payload is None:
+            return False
+        model = f"{FACE_MODEL} v{FACE_MODEL_VERSION}"
+        if payload["model"] != model:
+            print(f"⚠️ Cached gallery was built with {payload['model']}, this kiosk runs {model}; ignoring it")
+            return False
+        ids = [student["id"] for student in payload["students"]]
+        matrix = np.frombuffer(base64.b64decode(payload["embeddings"]), dtype=np.float32)
+        self.matcher = FaceMatcher(ids, list(matrix.reshape(len(ids), payload["dim"]))) if ids else FaceMatcher([], [])
+        self.names = {student["id"]: student["name"] for student in payload["students"]}
+        return True
+
+    def refresh_gallery(self):
+        etag, _ = self.store.load_gallery(self.course_id)
+        try:
+            etag, payload = self.api.fetch_gallery(self.course_id, etag)
+        except requests.RequestException as e:
+            self._set_online(False, e)
+            return
+        self._set_online(True)
+        if payload is not None:
+            self.store.save_gallery(self.course_id, etag, payload)
+            if self.load_gallery():
+                print(f"🗂️ Gallery updated: {len(self.matcher)} students")
+
+    # ----------------------------
+    # Sync
+    # ----------------------------
+    def sync(self):
+        """Send queued events in batches until the queue is empty or the API is unreachable."""
+        while True:
+            events = self.store.pending(KIOSK_SYNC_BATCH)
+            if not events:
+                return
+            try:
+                result = self.api.sync(events)
+            except requests.RequestException as e:
+                self._set_online(False, e)
+                return
+            self._set_online(True)
+            # Rejected events (e.g. a since-deleted student) would fail forever; stop resending them
+            self.store.mark_synced(result["stored"] + result["rejected"])
+            print(f"📤 Synced {len(result['stored'])} events ({len(result['rejected'])} rejected)")
+            if len(events) < KIOSK_SYNC_BATCH:
+                return
+
+    def _set_online(self, online: bool, error: Exception = None):
+        if online != self.online:
+            print("🌐 API reachable again" if online else f"📴 Working offline: {error}")
+        self.online = online
+
+    def _background(self):
+        next_refresh = 0
+        while not self._stop.is_set():
+            if time.monotonic() >= next_refresh:
+                self.refresh_gallery()
+                self.store.prune()
+                next_refresh = time.monotonic() + KIOSK_GALLERY_REFRESH
+            self.sync()
+            self._stop.wait(KIOSK_SYNC_INTERVAL)
+
+    # ----------------------------
+    # Recognition
+    # ----------------------------
+    def process_frame(self, frame: np.ndarray) -> list[tuple[int, float]]:
+        """
+        Recognize the faces in one camera frame and queue attendance for
+        newly recognized students. Faces already identified on earlier
+        frames, or still unmatched after KIOSK_UNKNOWN_AFTER tries, are
+        tracked, not embedded again. Returns what was queued.
+        """
+        boxes, embeddings = embed_new_faces(frame, self.tracker.settled_boxes(KIOSK_UNKNOWN_AFTER))
+        tracks = self.tracker.update(boxes)
+        pending = [
+            i for i in embeddings
+            if tracks[i].student_id is None and tracks[i].attempts < KIOSK_UNKNOWN_AFTER
+        ]
+        if not pending:
+            return []
+
+        queued = []
+        matches = self.matcher.match_many(np.vstack([embeddings[i] for i in pending]), MATCH_THRESHOLD)
+        for i, match in zip(pending, matches):
+            if not match:
+                tracks[i].attempts += 1
+                continue
+            student_id, distance = match
+            tracks[i].student_id, tracks[i].distance = match
+            last = self.last_queued.get(student_id)
+            if last is not None and time.monotonic() - last < KIOSK_REPEAT_AFTER:
+                continue
+            self.store.enqueue(student_id, self.course_id, distance)
+            self.last_queued[student_id] = time.monotonic()
+            queued.append(match)
+            print(f"✅ {self.names.get(student_id, student_id)} (confidence {1 - distance:.2f})")
+        return queued
+
+    def run(self, camera: int = KIOSK_CAMERA):
+        """Capture and recognize until interrupted; syncing runs in the background."""
+        get_face_model().warm_up()
+        if self.load_gallery():
+            print(f"🗂️ Cached gallery: {len(self.matcher)} students")
+        worker = threading.Thread(target=self._background, daemon=True)
+        worker.start()
+
+        cap = cv2.VideoCapture(camera)
+        try:
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    print("⚠️ Unable to read from camera; retrying")
+                    cap.release()
+                    time.sleep(1)
+                    cap = cv2.VideoCapture(camera)
+                    continue
+                self.process_frame(frame)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            cap.release()
+            self._stop.set()
+            worker.join()
+            self.sync()  # last attempt before exiting
+            print(f"👋 Kiosk stopped: {self.store.counts()}")
+
 
-            if result["verified"]:
-                student_name = os.path.splitext(file)[0].replace("_", " ")
-                print(f"✅ Match found: {student_name}")
-
-                # Find student in database
-                student = db.query(Students).filter(Students.student_name == student_name).first()
-
-                if student:
-                    # Create attendance record
-                    new_record = Attendance(
-                        student_id=student.student_id,
-                        course_id=1,  # temporary placeholder
-                        date=datetime.now().date(),
-                        time_in=datetime.now().time(),
-                        status="Present",
-                        recognized_face=True
-                    )
-                    db.add(new_record)
-                    db.commit()
-
-                    return {
-                        "status": "success",
-                        "student": student_name,
-                        "confidence": round(result["distance"], 4)
-                    }
-
-        return {"status": "not_found", "message": "No face match found"}
-
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline-capable attendance kiosk")
+    parser.add_argument("--course-id", type=int, default=KIOSK_COURSE_ID)
+    parser.add_argument("--camera", type=int, default=KIOSK_CAMERA)
+    parser.add_argument("--db", default=KIOSK_DB_PATH, help="local SQLite queue file")
+    args = parser.parse_args()
+    Kiosk(args.course_id, LocalStore(args.db), ApiClient()).run(args.camera)
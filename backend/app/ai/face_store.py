@@ -0,0 +1,71 @@
+import cv2
+import hashlib
+import numpy as np
+import os
+
+# ------------------------------------------------------------
+# STORE CONFIGURATION
+# ------------------------------------------------------------
+# Normalized face crops live here, one file per distinct crop. Defaults to
+# backend/face_store so it does not depend on the working directory.
+FACE_STORE_DIR = os.getenv(
+    "FACE_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "face_store"),
+)
+# Side of the square crops; at least the largest model input so any model can be re-run on them
+FACE_CROP_SIZE = int(os.getenv("FACE_CROP_SIZE", "224"))
+
+
+# ------------------------------------------------------------
+# NORMALIZED CROPS
+# ------------------------------------------------------------
+def normalize_crop(face: np.ndarray) -> np.ndarray:
+    """
+    Turn an aligned face crop (BGR, floats in 0..1) into the stored form:
+    a FACE_CROP_SIZE square uint8 image, letterboxed with black borders.
+    """
+    face = np.clip(np.asarray(face) * 255, 0, 255).astype(np.uint8)
+    height, width = face.shape[:2]
+    scale = FACE_CROP_SIZE / max(height, width)
+    resized = cv2.resize(
+        face,
+        (max(1, round(width * scale)), max(1, round(height * scale))),
+        interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR,
+    )
+    crop = np.zeros((FACE_CROP_SIZE, FACE_CROP_SIZE, 3), dtype=np.uint8)
+    top = (FACE_CROP_SIZE - resized.shape[0]) // 2
+    left = (FACE_CROP_SIZE - resized.shape[1]) // 2
+    crop[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    return crop
+
+
+def content_hash(crop: np.ndarray) -> str:
+    """SHA-256 of the crop's pixels; identical crops share one file and one embedding."""
+    return hashlib.sha256(np.ascontiguousarray(crop).tobytes()).hexdigest()
+
+
+def crop_path(crop_hash: str) -> str:
+    return os.path.join(FACE_STORE_DIR, crop_hash[:2], f"{crop_hash}.png")
+
+
+def put_crop(crop: np.ndarray) -> str:
+    """Store a normalized crop under its content hash (once) and return the hash."""
+    crop_hash = content_hash(crop)
+    path = crop_path(crop_hash)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        ok, encoded = cv2.imencode(".png", crop)
+        if not ok:
+            raise ValueError("Could not encode face crop")
+        with open(tmp_path, "wb") as f:
+            f.write(encoded.tobytes())
+        os.replace(tmp_path, path)
+    return crop_hash
+
+
+def get_crop(crop_hash: str) -> np.ndarray:
+    crop = cv2.imread(crop_path(crop_hash), cv2.IMREAD_COLOR)
+    if crop is None:
+        raise ValueError(f"Stored face crop {crop_hash} is missing")
+    return crop
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+import cv2
+import numpy as np
+import os
+import threading
+import time
+
+# ------------------------------------------------------------
+# CACHE CONFIGURATION
+# ------------------------------------------------------------
+FRAME_CACHE_SIZE = int(os.getenv("FRAME_CACHE_SIZE", "1024"))
+FRAME_CACHE_TTL = float(os.getenv("FRAME_CACHE_TTL", "5"))
+# Max differing hash bits (out of 64) for two crops to count as the same frame
+FRAME_CACHE_MAX_DISTANCE = int(os.getenv("FRAME_CACHE_MAX_DISTANCE", "4"))
+
+
+def perceptual_hash(face_crop: np.ndarray) -> int:
+    """
+    64-bit difference hash of a face crop: shrink to 9x8 grayscale and
+    record whether each pixel is brighter than its right-hand neighbour.
+    Small changes in lighting, noise or JPEG quality flip only a few bits.
+    """
+    gray = face_crop if face_crop.ndim == 2 else cv2.cvtColor(face_crop, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+# ------------------------------------------------------------
+# NEAR-DUPLICATE CACHE
+# ------------------------------------------------------------
+class FrameCache:
+    """
+    Remembers the embedding of recently seen face crops so a near-identical
+    crop from a kiosk or webcam a moment later skips the embedding model.
+    Entries belong to a `scope` (one client and course) and only match
+    lookups from the same scope: two different people can share a hash, and
+    a crop from one camera must never be answered with another's embedding.
+    Entries expire after `ttl` seconds; the least recently used are evicted
+    beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = FRAME_CACHE_SIZE, ttl: float = FRAME_CACHE_TTL,
+                 max_distance: int = FRAME_CACHE_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._entries = OrderedDict()  # (scope, hash) -> (stored_at, embedding)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, scope, key: int):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            for stored in reversed(self._entries):  # most recent first
+                stored_scope, stored_key = stored
+                if stored_scope != scope or (stored_key ^ key).bit_count() > self.max_distance:
+                    continue
+                stored_at, embedding = self._entries[stored]
+                # A hit moves its entry to the back, past older ones that
+                # _expire has not reached, so check its age here too
+                if now - stored_at >= self.ttl:
+                    continue
+                self._entries.move_to_end(stored)
+                self.hits += 1
+                return embedding
+            self.misses += 1
+            return None
+
+    def put(self, scope, key: int, embedding: np.ndarray):
+        with self._lock:
+            self._entries[(scope, key)] = (time.monotonic(), embedding)
+            self._entries.move_to_end((scope, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _expire(self, now: float):
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if now - oldest[0] < self.ttl:
+                break
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+                "memory_bytes": sum(embedding.nbytes + 64 for _, embedding in self._entries.values()),
+            }
+
+
+frame_cache = FrameCache()
@@ -0,0 +1,439 @@
+from sqlalchemy.orm import Session
+from app.ai.ann_index import IVFIndex
+from app.ai.face_embeddings import FACE_MODEL, FACE_MODEL_VERSION, load_embeddings
+from app.ai.matcher import FaceMatcher, normalize
+from app.ai.quantization import quantize
+from collections import OrderedDict
+from contextlib import contextmanager
+import fcntl
+import mmap
+import numpy as np
+import os
+import shutil
+import threading
+import time
+
+# ------------------------------------------------------------
+# INDEX CONFIGURATION
+# ------------------------------------------------------------
+# "ivf" = approximate search for large galleries, "exact" = always brute force
+FACE_INDEX = os.getenv("FACE_INDEX", "ivf")
+# Galleries smaller than this are searched exactly even when FACE_INDEX=ivf
+FACE_INDEX_EXACT_BELOW = int(os.getenv("FACE_INDEX_EXACT_BELOW", "2000"))
+# Number of IVF clusters scanned per probe
+FACE_INDEX_NPROBE = int(os.getenv("FACE_INDEX_NPROBE", "8"))
+# Where the index is saved so workers start warm
+FACE_INDEX_DIR = os.getenv("FACE_INDEX_DIR", "indexes")
+# Storage for the scanned vectors: float32, float16 or int8. The best
+# candidates are always re-scored at float32; int8 scans a quarter of the
+# bytes at close to float32 speed, float16 halves them but widens slowly on CPU
+FACE_INDEX_DTYPE = os.getenv("FACE_INDEX_DTYPE", "float32")
+# Registrations are appended to the current generation's change log; after
+# this many the log is folded into a new generation
+FACE_INDEX_COMPACT_AFTER = int(os.getenv("FACE_INDEX_COMPACT_AFTER", "256"))
+# Course galleries kept in memory per worker, and how long before one is reloaded
+FACE_COURSE_CACHE_SIZE = int(os.getenv("FACE_COURSE_CACHE_SIZE", "256"))
+FACE_COURSE_CACHE_TTL = int(os.getenv("FACE_COURSE_CACHE_TTL", "300"))
+
+INDEX_TYPES = {"exact": FaceMatcher, "ivf": IVFIndex}
+_MAPPED = {"matrix", "codes"}  # large arrays, memory-mapped instead of read
+
+_index = None
+_generation = None
+_lock = threading.Lock()
+
+_course_galleries = OrderedDict()  # course_id -> (loaded_at, version, FaceMatcher)
+_course_lock = threading.Lock()
+
+
+def index_dir() -> str:
+    model = FACE_MODEL.replace(" ", "_").lower()
+    return os.path.join(FACE_INDEX_DIR, f"faces-{model}-v{FACE_MODEL_VERSION}")
+
+
+# ------------------------------------------------------------
+# BUILD / SAVE / LOAD
+# ------------------------------------------------------------
+# The index is saved as plain .npy files in a new "generation" folder, and
+# a small CURRENT file names the live generation. Every worker memory-maps
+# the same read-only files, so the gallery is held once in the OS page
+# cache no matter how many workers run, and a save becomes visible to all
+# of them through one atomic rename of CURRENT. Single registrations do not
+# rewrite the arrays: they are appended to the generation's change log (see
+# CHANGE LOG below), which is folded into a new generation now and then.
+def build_index(pairs):
+    """
+    Build the configured index from (student_id, embedding) pairs,
+    falling back to exact search for small galleries.
+    """
+    if FACE_INDEX != "ivf" or len(pairs) < FACE_INDEX_EXACT_BELOW:
+        return FaceMatcher.from_pairs(pairs)
+    student_ids, embeddings = zip(*pairs)
+    return IVFIndex.build(student_ids, embeddings, nprobe=FACE_INDEX_NPROBE)
+
+
+def _current_generation(directory: str = None):
+    try:
+        with open(os.path.join(directory or index_dir(), "CURRENT")) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def save_index(index, directory: str = None):
+    """
+    Write the index as a new generation, quantizing the vectors when
+    FACE_INDEX_DTYPE asks for it, then atomically make it the current one.
+    """
+    directory = directory or index_dir()
+    previous = _current_generation(directory)
+    generation = f"{time.time_ns():x}-{os.getpid()}"
+    target = os.path.join(directory, generation)
+    os.makedirs(target)
+
+    arrays = dict(index.state(), kind=np.array(index.kind))
+    if FACE_INDEX_DTYPE != "float32" and arrays["matrix"].size:
+        arrays["codes"], scales = quantize(arrays["matrix"], FACE_INDEX_DTYPE)
+        if scales is not None:
+            arrays["scales"] = scales
+    for name, array in arrays.items():
+        np.save(os.path.join(target, f"{name}.npy"), array)
+
+    tmp_path = os.path.join(directory, f"CURRENT.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(generation)
+    os.replace(tmp_path, os.path.join(directory, "CURRENT"))
+
+    # Keep the previous generation for workers still switching over. Older
+    # ones can go; workers that still map them keep their pages until they reload.
+    for name in os.listdir(directory):
+        if name not in (generation, previous, "CURRENT", "LOCK", "courses") and not name.endswith(".tmp"):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def load_index(directory: str = None):
+    """Memory-map the current generation; returns (index, generation)."""
+    directory = directory or index_dir()
+    for attempt in range(3):
+        generation = _current_generation(directory)
+        target = os.path.join(directory, generation)
+        try:
+            state = {
+                name[:-4]: np.load(os.path.join(target, name), mmap_mode="r" if name[:-4] in _MAPPED else None)
+                for name in os.listdir(target)
+                if name.endswith(".npy")
+            }
+            return INDEX_TYPES[str(state["kind"])].from_state(state), generation
+        except FileNotFoundError:
+            if attempt == 2:  # pruned while we were reading it; retry with the newer one
+                raise
+
+
+def _maybe_rebuild(index):
+    """Switch to IVF once the gallery outgrows exact search, and retrain IVF after heavy growth."""
+    if FACE_INDEX != "ivf" or len(index) < FACE_INDEX_EXACT_BELOW:
+        return index
+    if index.kind == "exact":
+        return IVFIndex.build(index.student_ids, index.matrix, nprobe=FACE_INDEX_NPROBE)
+    if len(index) > 4 * index.trained_size:
+        student_ids, matrix = index.vectors()
+        return IVFIndex.build(student_ids, matrix, nprobe=FACE_INDEX_NPROBE)
+    return index
+
+
+# ------------------------------------------------------------
+# CHANGE LOG
+# ------------------------------------------------------------
+# Each generation folder may hold a changes.log: one record per registered or
+# removed student, appended under the writer lock. A record is the student
+# id and vector length as two int64, then the float32 vector (length 0 means
+# removed). Workers replay new records on their next lookup, so a single
+# registration writes a few KB instead of a whole new generation.
+_RECORD_HEADER = 16
+
+
+def _log_path(generation: str, directory: str = None) -> str:
+    return os.path.join(directory or index_dir(), generation, "changes.log")
+
+
+def _read_changes(path: str, offset: int):
+    """Complete records after `offset`, as ([(student_id, vector or None)], new offset)."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], offset
+    changes, position = [], 0
+    while position + _RECORD_HEADER <= len(data):
+        student_id, dim = np.frombuffer(data, np.int64, 2, position)
+        end = position + _RECORD_HEADER + 4 * int(dim)
+        if end > len(data):  # still being written, or cut short by a crash
+            break
+        vector = np.frombuffer(data, np.float32, int(dim), position + _RECORD_HEADER) if dim else None
+        changes.append((int(student_id), vector))
+        position = end
+    return changes, offset + position
+
+
+class LoggedIndex:
+    """
+    A saved (memory-mapped) index plus the changes logged since it was
+    saved. Changed students are searched exactly in a small in-memory
+    matcher and hidden from the saved index, whose arrays stay shared.
+    """
+
+    def __init__(self, base, generation: str):
+        self.base = base
+        self.kind = base.kind
+        self.generation = generation
+        self.log_offset = 0
+        self.changed = {}  # student_id -> normalized vector, or None once removed
+        self.delta = FaceMatcher([], [])
+        self._hidden = 0  # students of the saved index that a change replaced or removed
+
+    def __len__(self):
+        return len(self.base) - self._hidden + len(self.delta)
+
+    def __contains__(self, student_id):
+        if student_id in self.changed:
+            return self.changed[student_id] is not None
+        return student_id in self.base
+
+    @property
+    def nlist(self):
+        return self.base.nlist
+
+    def apply(self, changes: list):
+        """Apply (student_id, vector or None) changes in order."""
+        for student_id, vector in changes:
+            if student_id not in self.changed and student_id in self.base:
+                self._hidden += 1
+            self.changed[student_id] = None if vector is None else normalize(vector)
+        ids = [student_id for student_id, vector in self.changed.items() if vector is not None]
+        # Swapped in whole, so a search running meanwhile sees the old or the new one
+        self.delta = FaceMatcher(ids, [self.changed[student_id] for student_id in ids])
+
+    def refresh(self):
+        """Replay records other workers appended since the last call."""
+        changes, self.log_offset = _read_changes(_log_path(self.generation), self.log_offset)
+        if changes:
+            self.apply(changes)
+
+    def append(self, student_id: int, embedding):
+        """Log one change and apply it. Call with _writer_lock held, after refresh()."""
+        vector = np.empty(0, dtype=np.float32) if embedding is None else np.asarray(embedding, dtype=np.float32)
+        record = np.array([student_id, len(vector)], dtype=np.int64).tobytes() + vector.tobytes()
+        with open(_log_path(self.generation), "ab") as f:
+            f.truncate(self.log_offset)  # drop a record left half-written by a crash
+            f.write(record)
+        self.log_offset += len(record)
+        self.apply([(student_id, None if embedding is None else vector)])
+
+    def search(self, probe: np.ndarray, k: int = 5, **kwargs) -> list[tuple[int, float]]:
+        # Fetch extra candidates from the saved index to make up for hidden ones
+        saved = [
+            candidate for candidate in self.base.search(probe, k + self._hidden, **kwargs)
+            if candidate[0] not in self.changed
+        ]
+        return sorted(saved + self.delta.search(probe, k), key=lambda candidate: candidate[1])[:k]
+
+    def compacted(self):
+        """A plain index with every change folded in, ready to be saved as a new generation."""
+        if self.base.kind == "ivf":
+            index = IVFIndex.from_state(self.base.state())
+            for student_id, vector in self.changed.items():
+                if vector is None:
+                    index.remove(student_id)
+                else:
+                    index.add(student_id, vector)
+        else:
+            keep = ~np.isin(self.base.student_ids, list(self.changed))
+            student_ids = np.concatenate([self.base.student_ids[keep], self.delta.student_ids])
+            rows = [self.base.matrix[keep]] if keep.any() else []
+            if len(self.delta):
+                rows.append(self.delta.matrix)
+            index = FaceMatcher(student_ids, rows)
+        return _maybe_rebuild(index)
+
+
+# ------------------------------------------------------------
+# PROCESS-WIDE INDEX
+# ------------------------------------------------------------
+# Readers only take _lock to swap in a newer generation or replay the log.
+# Writers also hold an flock on the index directory for the whole
+# read-modify-write, so two workers registering faces at once cannot both
+# start from the same state and have one of them overwrite the other's change.
+@contextmanager
+def _writer_lock(directory: str = None):
+    directory = directory or index_dir()
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "LOCK"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _load_current() -> LoggedIndex:
+    base, generation = load_index()
+    index = LoggedIndex(base, generation)
+    index.refresh()
+    return index
+
+
+def get_index(db: Session):
+    """
+    Return this worker's index, mapping it from disk on first use or when
+    another worker has saved a newer generation, and replaying any logged
+    changes. Built from the database only when no saved index exists.
+    """
+    global _index, _generation
+    with _lock:
+        generation = _current_generation()
+        if _index is not None and generation == _generation:
+            _index.refresh()
+            return _index
+        if generation is not None:
+            _index = _load_current()
+            _generation = _index.generation
+            return _index
+    # Nothing saved yet: one worker builds it, the others wait and map its copy
+    with _writer_lock():
+        if _current_generation() is None:
+            return _publish(build_index(load_embeddings(db)))
+    return get_index(db)
+
+
+def _publish(index):
+    """Save a complete index and switch this worker to the mapped copy. Call with _writer_lock held."""
+    global _index, _generation
+    save_index(index)
+    loaded = _load_current()
+    with _lock:
+        _index, _generation = loaded, loaded.generation
+    return _index
+
+
+def _update_index(db: Session, student_id: int, embedding):
+    """Log one student's new vector (None = removed), folding the log into a new generation when it is long."""
+    with _writer_lock():
+        if _current_generation() is None:
+            # The database already holds the change
+            return _publish(build_index(load_embeddings(db)))
+        # Under the lock: another worker may have just logged or saved
+        index = get_index(db)
+        with _lock:
+            index.append(student_id, embedding)
+        if len(index.changed) >= FACE_INDEX_COMPACT_AFTER:
+            return _publish(index.compacted())
+        return index
+
+
+def rebuild_index(db: Session):
+    """Recompute the index from every stored embedding and save it."""
+    with _writer_lock():
+        return _publish(build_index(load_embeddings(db)))
+
+
+def add_to_index(db: Session, student_id: int, embedding: np.ndarray):
+    """
+    Insert or replace one student's vector. Appends to the change log and
+    now and then saves a new generation, so call it from a thread, not the
+    event loop.
+    """
+    _update_index(db, student_id, embedding)
+
+
+def remove_from_index(db: Session, student_id: int):
+    _update_index(db, student_id, None)
+
+
+def _is_mapped(array) -> bool:
+    while isinstance(array, np.ndarray):
+        array = array.base
+    return isinstance(array, mmap.mmap)
+
+
+def index_info() -> dict:
+    """Size and storage of this worker's index, for the metrics endpoint."""
+    index = _index
+    if index is None:
+        return {"loaded": False}
+    arrays = [getattr(index.base, name, None) for name in ("codes", "matrix")]
+    return {
+        "loaded": True,
+        "kind": index.kind,
+        "students": len(index),
+        "dtype": FACE_INDEX_DTYPE if getattr(index.base, "codes", None) is not None else "float32",
+        "generation": _generation,
+        "logged_changes": len(index.changed),
+        "mapped_bytes": sum(a.nbytes for a in arrays if _is_mapped(a)),
+    }
+
+
+def search(index, probe: np.ndarray, k: int, exact: bool = False) -> list[tuple[int, float]]:
+    """Search the index; `exact=True` scans every vector for accuracy checks."""
+    if exact and index.kind == "ivf":
+        return index.search(probe, k, nprobe=index.nlist)
+    return index.search(probe, k)
+
+
+# ------------------------------------------------------------
+# COURSE-SCOPED GALLERIES
+# ------------------------------------------------------------
+# A lecture only needs to search the students enrolled in its course,
+# so each course gets a small exact gallery built from StudentCourse.
+# Every worker caches its own copy, tagged with a version shared through the
+# index directory: the index generation, which changes whenever any face is
+# (re)registered, plus a per-course stamp rewritten when the roster changes.
+# A worker reloads a course as soon as either differs from what it loaded.
+def _course_stamp_path(course_id: int) -> str:
+    return os.path.join(index_dir(), "courses", str(course_id))
+
+
+def _course_version(course_id: int) -> tuple:
+    try:
+        with open(_course_stamp_path(course_id)) as f:
+            stamp = f.read().strip()
+    except FileNotFoundError:
+        stamp = None
+    return _current_generation(), stamp
+
+
+def get_course_gallery(db: Session, course_id: int) -> FaceMatcher:
+    """Return the cached gallery for a course, reloading it when its version changed or after the TTL."""
+    version = _course_version(course_id)
+    with _course_lock:
+        cached = _course_galleries.get(course_id)
+        if cached and cached[1] == version and time.monotonic() - cached[0] < FACE_COURSE_CACHE_TTL:
+            _course_galleries.move_to_end(course_id)
+            return cached[2]
+    return _load_course_gallery(db, course_id, version)
+
+
+def _load_course_gallery(db: Session, course_id: int, version: tuple) -> FaceMatcher:
+    # `version` is read before the embeddings: a change made while loading
+    # leaves this copy tagged as stale rather than as current
+    gallery = FaceMatcher.from_pairs(load_embeddings(db, course_id=course_id))
+    with _course_lock:
+        _course_galleries[course_id] = (time.monotonic(), version, gallery)
+        _course_galleries.move_to_end(course_id)
+        while len(_course_galleries) > FACE_COURSE_CACHE_SIZE:
+            _course_galleries.popitem(last=False)
+    return gallery
+
+
+def refresh_course_gallery(db: Session, course_id: int) -> FaceMatcher:
+    """
+    Reload a course's gallery after its roster changed, and bump the
+    course's shared stamp so every other worker reloads it too.
+    """
+    path = _course_stamp_path(course_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(f"{time.time_ns():x}-{os.getpid()}")
+    os.replace(tmp_path, path)
+    return _load_course_gallery(db, course_id, _course_version(course_id))
@@ -0,0 +1,88 @@
+import cv2
+import numpy as np
+import os
+import struct
+
+# ------------------------------------------------------------
+# PREPROCESSING CONFIGURATION
+# ------------------------------------------------------------
+# Single-face probes (webcam, kiosk, uploads) and reference photos are
+# decoded at no more than this longest side; faces in them stay far
+# larger than the model input.
+FACE_PROBE_MAX_SIDE = int(os.getenv("FACE_PROBE_MAX_SIDE", "960"))
+
+# JPEG can be decoded directly at 1/2, 1/4 or 1/8 scale, skipping most of the work
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def image_size(image_data: bytes):
+    """Read (width, height) from a JPEG or PNG header without decoding, or None."""
+    if image_data[:8] == b"\x89PNG\r\n\x1a\n" and len(image_data) >= 24:
+        return struct.unpack(">II", image_data[16:24])
+    if image_data[:2] != b"\xff\xd8":
+        return None
+
+    pos = 2
+    while pos + 9 <= len(image_data):
+        if image_data[pos] != 0xFF:
+            return None
+        marker = image_data[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker in _JPEG_SOF:
+            height, width = struct.unpack(">HH", image_data[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + struct.unpack(">H", image_data[pos + 2:pos + 4])[0]
+    return None
+
+
+# ------------------------------------------------------------
+# SHARED DECODE STAGE
+# ------------------------------------------------------------
+def decode_image(image_data: bytes, max_side: int = FACE_PROBE_MAX_SIDE) -> tuple[np.ndarray, float]:
+    """
+    Decode an encoded image to a BGR array whose longest side is at most
+    `max_side`, using JPEG's reduced-resolution decode where possible.
+    Returns the frame and its scale relative to the original image, so
+    face boxes can be mapped back to original pixels.
+    """
+    buffer = np.frombuffer(image_data, np.uint8)
+    size = image_size(image_data)
+    flag = cv2.IMREAD_COLOR
+    if size and max_side:
+        for reduction, reduced_flag in _REDUCED_FLAGS:
+            if max(size) / reduction >= max_side:
+                flag = reduced_flag
+                break
+
+    frame = cv2.imdecode(buffer, flag)
+    if frame is None:
+        raise ValueError("Could not decode image")
+
+    original_side = max(size) if size else max(frame.shape[:2])
+    if max_side and max(frame.shape[:2]) > max_side:
+        shrink = max_side / max(frame.shape[:2])
+        frame = cv2.resize(frame, None, fx=shrink, fy=shrink, interpolation=cv2.INTER_AREA)
+    return frame, max(frame.shape[:2]) / original_side
+
+
+def load_image(img, max_side: int = FACE_PROBE_MAX_SIDE) -> np.ndarray:
+    """Return `img` (file path, encoded bytes or BGR array) as a BGR array, without temp files."""
+    if isinstance(img, np.ndarray):
+        return img
+    if isinstance(img, str):
+        try:
+            with open(img, "rb") as f:
+                img = f.read()
+        except OSError:
+            raise ValueError("Could not read image")
+    return decode_image(img, max_side)[0]
+
+
+def scale_box(box: dict, scale: float) -> dict:
+    """Map a face box from a downscaled frame back to original-image pixels."""
+    if scale == 1:
+        return box
+    return {key: int(round(box[key] / scale)) for key in ("x", "y", "w", "h")}
@@ -0,0 +1,233 @@
+from concurrent.futures import ProcessPoolExecutor
+from deepface.modules import preprocessing
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from app.ai.batching import MicroBatcher
+from app.ai.face_model import get_face_model, largest_face, load_face_model
+from app.ai.face_store import get_crop, normalize_crop, put_crop
+from app.ai.frame_cache import frame_cache, perceptual_hash
+from app.ai.image_pipeline import decode_image, scale_box
+from app.ai.tracking import overlaps_any
+import asyncio
+import multiprocessing
+import numpy as np
+import os
+
+# ------------------------------------------------------------
+# POOL CONFIGURATION
+# ------------------------------------------------------------
+# Worker processes, each holding its own loaded model. 0 = run in-process
+# on the threadpool (handy for local development).
+FACE_POOL_SIZE = int(os.getenv("FACE_POOL_SIZE", "2"))
+# Jobs allowed to run or wait at once before requests are turned away
+FACE_POOL_MAX_PENDING = int(os.getenv("FACE_POOL_MAX_PENDING", str(max(FACE_POOL_SIZE, 1) * 4)))
+# Seconds clients are told to wait before retrying when the queue is full
+FACE_POOL_RETRY_AFTER = int(os.getenv("FACE_POOL_RETRY_AFTER", "2"))
+# Classroom photos are downscaled to this longest side before face detection
+CLASSROOM_MAX_SIDE = int(os.getenv("CLASSROOM_MAX_SIDE", "1920"))
+
+
+# ------------------------------------------------------------
+# JOBS (run inside the worker processes)
+# ------------------------------------------------------------
+def _init_worker():
+    load_face_model()
+
+
+def _ping():
+    return os.getpid()
+
+
+def detect_probe(image_data: bytes) -> np.ndarray:
+    """
+    Decode a probe image and return its largest face, resized to the model
+    input size, as a uint8 BGR crop. Small enough to send back cheaply and
+    to hash for the near-duplicate cache. Returns None when the crop is
+    empty; raises ValueError if the image cannot be decoded.
+    """
+    model = get_face_model()
+    frame, _ = decode_image(image_data)
+    face = largest_face(model.detect(frame, enforce_detection=False))["face"]
+    if face.size == 0:
+        return None
+    resized = preprocessing.resize_image(face, model.target_size)[0]
+    return np.clip(resized * 255, 0, 255).round().astype(np.uint8)
+
+
+def embed_crops(crops: list[np.ndarray]) -> list[np.ndarray]:
+    """Embed probe crops from detect_probe in one forward pass."""
+    return list(get_face_model().embed_faces([crop / 255 for crop in crops]))
+
+
+def store_reference_images(images: list) -> list:
+    """
+    For each reference photo (file path or encoded bytes), store its largest
+    face as a normalized crop in the face store and embed the crop, all
+    crops in one forward pass. Returns (content_hash, embedding) per photo,
+    or a ValueError for photos that cannot be read or show no face.
+    """
+    model = get_face_model()
+    results = [None] * len(images)
+    crops, positions = [], []
+    for i, image in enumerate(images):
+        try:
+            crops.append(normalize_crop(largest_face(model.detect(image, enforce_detection=True))["face"]))
+            positions.append(i)
+        except ValueError as e:
+            results[i] = e
+
+    if crops:
+        for i, crop, embedding in zip(positions, crops, model.embed_faces([crop / 255 for crop in crops])):
+            results[i] = (put_crop(crop), embedding)
+    return results
+
+
+def embed_stored_crops(crop_hashes: list[str]) -> list:
+    """
+    Re-embed crops from the face store with the current model, in one
+    forward pass. Missing crops get a ValueError instead.
+    """
+    results = [None] * len(crop_hashes)
+    crops, positions = [], []
+    for i, crop_hash in enumerate(crop_hashes):
+        try:
+            crops.append(get_crop(crop_hash))
+            positions.append(i)
+        except ValueError as e:
+            results[i] = e
+
+    if crops:
+        for i, embedding in zip(positions, get_face_model().embed_faces([crop / 255 for crop in crops])):
+            results[i] = embedding
+    return results
+
+
+def embed_classroom_image(image_data: bytes) -> tuple[list[dict], np.ndarray]:
+    """
+    Decode a classroom photo, detect every face and embed them in batches.
+    Returns face boxes in original-image pixels and an (n, dim) matrix.
+    """
+    frame, scale = decode_image(image_data, CLASSROOM_MAX_SIDE)
+    areas, embeddings = get_face_model().embed_all(frame)
+    return [scale_box(area, scale) for area in areas], embeddings
+
+
+def embed_new_faces(frame: np.ndarray, skip_boxes: list[dict], scale: float = 1.0) -> tuple[list[dict], dict]:
+    """
+    Detect every face in a decoded frame and embed only those that do not
+    overlap an already-identified face from the previous frame.
+    Returns all boxes and {box position: embedding} for the embedded ones.
+    """
+    model = get_face_model()
+    try:
+        faces = model.detect(frame, enforce_detection=True)
+    except ValueError:  # no face in the frame
+        return [], {}
+
+    boxes = [scale_box(f["facial_area"], scale) for f in faces]
+    todo = [i for i, box in enumerate(boxes) if not overlaps_any(box, skip_boxes)]
+    if not todo:
+        return boxes, {}
+    embeddings = model.embed_faces([faces[i]["face"] for i in todo])
+    return boxes, dict(zip(todo, embeddings))
+
+
+def embed_stream_frame(image_data: bytes, skip_boxes: list[dict]) -> tuple[list[dict], dict]:
+    """embed_new_faces for an encoded stream frame; boxes are in original-image pixels."""
+    try:
+        frame, scale = decode_image(image_data)
+    except ValueError:  # undecodable frame
+        return [], {}
+    return embed_new_faces(frame, skip_boxes, scale)
+
+
+# ------------------------------------------------------------
+# BOUNDED PROCESS POOL
+# ------------------------------------------------------------
+class InferencePool:
+    """
+    Runs CPU-bound decode/detect/embed work off the event loop.
+    At most `max_pending` jobs are accepted at once; beyond that callers
+    get 503 with Retry-After instead of an ever-growing queue.
+    """
+
+    def __init__(self, size: int = FACE_POOL_SIZE, max_pending: int = FACE_POOL_MAX_PENDING):
+        self.size = size
+        self.max_pending = max_pending
+        self.pending = 0
+        self.ready = False
+        self._executor = None
+
+    async def start(self):
+        """Spawn the workers and wait until every one has loaded its model."""
+        if self.size > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.size,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            loop = asyncio.get_running_loop()
+            # A worker answers only once its initializer has loaded the model,
+            # but one fast worker can take several pings, so wait until every
+            # process has answered at least once
+            answered = set()
+            while True:
+                answered.update(await asyncio.gather(
+                    *(loop.run_in_executor(self._executor, _ping) for _ in range(self.size))
+                ))
+                if len(answered) >= self.size:
+                    break
+                await asyncio.sleep(0.1)
+        else:
+            await run_in_threadpool(load_face_model)
+        self.ready = True
+
+    def shutdown(self):
+        self.ready = False
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def metrics(self) -> dict:
+        return {"size": self.size, "pending": self.pending, "max_pending": self.max_pending}
+
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Face recognition is busy, please retry shortly",
+                headers={"Retry-After": str(FACE_POOL_RETRY_AFTER)},
+            )
+
+        self.pending += 1
+        try:
+            if self._executor is None:
+                return await run_in_threadpool(fn, *args)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+
+inference_pool = InferencePool()
+
+
+# Concurrent single-face probes share one pool job and one forward pass
+probe_batcher = MicroBatcher(lambda crops: inference_pool.run(embed_crops, crops))
+
+
+async def embed_probe(image_data: bytes, scope) -> np.ndarray:
+    """
+    Embed the largest face in a probe image. Detection always runs; the
+    embedding is skipped when a near-identical crop was embedded moments ago
+    within the same `scope` (e.g. one client and course). Returns None when
+    no face could be cropped; raises ValueError if the image cannot be decoded.
+    """
+    crop = await inference_pool.run(detect_probe, image_data)
+    if crop is None:
+        return None
+    key = perceptual_hash(crop)
+    embedding = frame_cache.get(scope, key)
+    if embedding is None:
+        embedding = await probe_batcher.submit(crop)
+        frame_cache.put(scope, key, embedding)
+    return embedding
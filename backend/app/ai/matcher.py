@@ -0,0 +1,146 @@
+from app.ai.quantization import approx_similarities, rescored_candidates
+import numpy as np
+
+
+# ------------------------------------------------------------
+# VECTORIZED GALLERY MATCHER
+# ------------------------------------------------------------
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize a vector or each row of a matrix as float32.
+    Zero vectors are left as zeros.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def top_k(student_ids: np.ndarray, distances: np.ndarray, k: int) -> list[tuple[int, float]]:
+    """Pick the k smallest distances, best first, as (student_id, distance) pairs."""
+    k = min(k, len(distances))
+    if k <= 0:
+        return []
+    top = np.argpartition(distances, k - 1)[:k]
+    top = top[np.argsort(distances[top])]
+    return [(int(student_ids[i]), float(distances[i])) for i in top]
+
+
+class FaceMatcher:
+    """
+    Exact search index. Holds every gallery embedding as one normalized
+    float32 matrix so a probe is scored against all students with a single
+    matrix-vector product. Distances are cosine distances (0 = identical).
+
+    When loaded from a quantized index file, the scan runs over the
+    compact `codes` instead and only the best candidates are re-scored
+    against the full-precision (memory-mapped) matrix.
+    """
+
+    kind = "exact"
+
+    def __init__(self, student_ids, embeddings):
+        self.student_ids = np.asarray(student_ids, dtype=np.int64)
+        if len(self.student_ids):
+            self.matrix = normalize(np.vstack(embeddings))
+        else:
+            self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.codes = None
+        self.scales = None
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """Build from (student_id, embedding) pairs as returned by load_embeddings."""
+        if not pairs:
+            return cls([], [])
+        student_ids, embeddings = zip(*pairs)
+        return cls(student_ids, embeddings)
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def __contains__(self, student_id):
+        return bool(np.any(self.student_ids == student_id))
+
+    # ----------------------------
+    # Incremental updates
+    # ----------------------------
+    def add(self, student_id: int, embedding: np.ndarray):
+        """Insert a student, replacing any vector already stored for them."""
+        self.remove(student_id)
+        vector = normalize(embedding)[np.newaxis, :]
+        self.matrix = vector if not len(self) else np.vstack([self.matrix, vector])
+        self.student_ids = np.append(self.student_ids, np.int64(student_id))
+        self.codes = self.scales = None  # searched at full precision until saved again
+
+    def remove(self, student_id: int):
+        keep = self.student_ids != student_id
+        if not keep.all():
+            self.student_ids = self.student_ids[keep]
+            self.matrix = self.matrix[keep]
+            self.codes = self.scales = None
+
+    # ----------------------------
+    # Search
+    # ----------------------------
+    def search(self, probe: np.ndarray, k: int = 5) -> list[tuple[int, float]]:
+        """
+        Return the k closest students as (student_id, distance) pairs,
+        best match first.
+        """
+        if not len(self):
+            return []
+        probe = normalize(probe)
+        if self.codes is not None:
+            similarities = approx_similarities(self.codes, self.scales, probe)
+            rows, distances = rescored_candidates(similarities, self.matrix, probe, k)
+            return top_k(self.student_ids[rows], distances, k)
+        distances = 1 - self.matrix @ probe
+        return top_k(self.student_ids, distances, k)
+
+    def best_match(self, probe: np.ndarray, threshold: float):
+        """
+        Return (student_id, distance) of the global nearest neighbour,
+        or None if it is not closer than `threshold`.
+        """
+        candidates = self.search(probe, k=1)
+        if candidates and candidates[0][1] < threshold:
+            return candidates[0]
+        return None
+
+    def match_many(self, probes: np.ndarray, threshold: float) -> list:
+        """
+        Match several faces from one photo at once. Each student is given to
+        at most one face, closest pairs first. Returns (student_id, distance)
+        or None for each probe, in probe order.
+        """
+        matches = [None] * len(probes)
+        if not len(self) or not len(probes):
+            return matches
+
+        distances = 1 - self.matrix @ normalize(probes).T  # (students, faces)
+        rows, cols = np.nonzero(distances < threshold)
+        taken = set()
+        for i in np.argsort(distances[rows, cols]):
+            row, face = rows[i], cols[i]
+            if matches[face] is None and row not in taken:
+                matches[face] = (int(self.student_ids[row]), float(distances[row, face]))
+                taken.add(row)
+        return matches
+
+    # ----------------------------
+    # Persistence
+    # ----------------------------
+    def state(self) -> dict:
+        return {"student_ids": self.student_ids, "matrix": self.matrix}
+
+    @classmethod
+    def from_state(cls, state) -> "FaceMatcher":
+        """Rebuild from saved arrays; memory-mapped arrays are used in place, not copied."""
+        matcher = cls([], [])
+        matcher.student_ids = np.asarray(state["student_ids"], dtype=np.int64)
+        matcher.matrix = np.asarray(state["matrix"], dtype=np.float32)
+        if "codes" in state:
+            matcher.codes = state["codes"]
+            matcher.scales = state.get("scales")
+        return matcher
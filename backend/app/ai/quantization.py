@@ -0,0 +1,57 @@
+import numpy as np
+import os
+
+# ------------------------------------------------------------
+# QUANTIZATION CONFIGURATION
+# ------------------------------------------------------------
+# Candidates re-scored against the full-precision vectors after a quantized scan
+FACE_INDEX_RESCORE = int(os.getenv("FACE_INDEX_RESCORE", "32"))
+# Quantized rows are widened to float32 this many bytes at a time while scanning
+_SCAN_BLOCK_BYTES = 2**20
+
+DTYPES = ("float32", "float16", "int8")
+
+
+def quantize(matrix: np.ndarray, dtype: str):
+    """
+    Compress a normalized float32 matrix to `dtype`.
+    Returns (codes, scales); scales is None except for int8, where each
+    row is stored as round(row / scale) with its own scale.
+    """
+    if dtype == "float16":
+        return matrix.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127
+        scales[scales == 0] = 1
+        codes = np.round(matrix / scales[:, np.newaxis]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unsupported index dtype: {dtype}")
+
+
+def approx_similarities(codes: np.ndarray, scales, probe: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarity of a normalized probe to every quantized row,
+    widening a block of rows at a time so memory use stays flat.
+    """
+    rows_per_block = max(1, _SCAN_BLOCK_BYTES // (4 * max(1, codes.shape[1])))
+    similarities = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), rows_per_block):
+        block = codes[start:start + rows_per_block]
+        similarities[start:start + len(block)] = block.astype(np.float32) @ probe
+    if scales is not None:
+        similarities *= scales
+    return similarities
+
+
+def rescored_candidates(similarities: np.ndarray, matrix: np.ndarray, probe: np.ndarray, k: int, rows=None):
+    """
+    Take the best max(k, FACE_INDEX_RESCORE) rows by approximate similarity
+    and return (row positions, exact cosine distances) for them, read from
+    the full-precision `matrix`. `rows` maps positions to matrix rows when
+    only part of the matrix was scanned.
+    """
+    count = min(max(k, FACE_INDEX_RESCORE), len(similarities))
+    best = np.argpartition(-similarities, count - 1)[:count]
+    best.sort()  # read the memory-mapped rows in file order
+    matrix_rows = best if rows is None else rows[best]
+    return best, 1 - np.asarray(matrix[matrix_rows], dtype=np.float32) @ probe
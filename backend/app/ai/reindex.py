@@ -0,0 +1,154 @@
+from datetime import datetime
+from sqlalchemy import and_, exists
+from sqlalchemy.orm import Session, aliased
+from starlette.concurrency import run_in_threadpool
+from app.ai.face_embeddings import FACE_MODEL, FACE_MODEL_VERSION, add_face_images
+from app.ai.gallery import FACE_INDEX_DIR, rebuild_index
+from app.models import FaceImages
+import fcntl
+import json
+import os
+
+# ------------------------------------------------------------
+# REINDEX CONFIGURATION
+# ------------------------------------------------------------
+# Stored crops re-embedded and committed together
+FACE_REINDEX_BATCH_SIZE = int(os.getenv("FACE_REINDEX_BATCH_SIZE", "64"))
+
+# Shared by every worker: the lock decides which one runs the reindex, and
+# the status file lets any of them report its progress
+REINDEX_LOCK = os.path.join(FACE_INDEX_DIR, "REINDEX.lock")
+REINDEX_STATUS = os.path.join(FACE_INDEX_DIR, "reindex-status.json")
+
+
+def pending_crops(db: Session):
+    """
+    (student_id, content_hash) of every stored crop that has no embedding
+    for the configured model yet, oldest first. Finished crops drop out of
+    this query, so an interrupted reindex resumes where it stopped.
+    """
+    current = aliased(FaceImages)
+    embedded = exists().where(and_(
+        current.student_id == FaceImages.student_id,
+        current.content_hash == FaceImages.content_hash,
+        current.model_name == FACE_MODEL,
+        current.model_version == FACE_MODEL_VERSION,
+    ))
+    return (
+        db.query(FaceImages.student_id, FaceImages.content_hash)
+        .filter(~embedded)
+        .group_by(FaceImages.student_id, FaceImages.content_hash)
+        .order_by(FaceImages.student_id, FaceImages.content_hash)
+    )
+
+
+# ------------------------------------------------------------
+# CROSS-WORKER LOCK AND STATUS
+# ------------------------------------------------------------
+def try_lock():
+    """
+    Take the reindex lock without waiting. Returns the open lock file (close
+    it to release), or None when a reindex already runs in some worker. The
+    OS drops the lock if that worker dies, so a crash never blocks the next run.
+    """
+    os.makedirs(FACE_INDEX_DIR, exist_ok=True)
+    lock_file = open(REINDEX_LOCK, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def _write_status(status: dict):
+    tmp_path = f"{REINDEX_STATUS}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(status, f)
+    os.replace(tmp_path, REINDEX_STATUS)
+
+
+def read_status() -> dict:
+    """Progress of the current or last reindex, whichever worker runs it."""
+    try:
+        with open(REINDEX_STATUS) as f:
+            status = json.load(f)
+    except FileNotFoundError:
+        return {"state": "idle"}
+    if status["state"] == "running":
+        # Nobody holds the lock: the worker running it died mid-way
+        lock_file = try_lock()
+        if lock_file is not None:
+            lock_file.close()
+            status["state"] = "interrupted"
+    return status
+
+
+# ------------------------------------------------------------
+# REINDEX JOB
+# ------------------------------------------------------------
+def _next_batch(db: Session, failed: set) -> list:
+    return [
+        row for row in pending_crops(db).limit(FACE_REINDEX_BATCH_SIZE + len(failed))
+        if row.content_hash not in failed
+    ][:FACE_REINDEX_BATCH_SIZE]
+
+
+def _write_batch(db: Session, by_student: dict):
+    for student_id, images in by_student.items():
+        add_face_images(db, student_id, images)
+    db.commit()
+
+
+async def reindex(db: Session, embed):
+    """
+    Re-embed every stored crop with the configured model, batch by batch.
+    `embed(crop_hashes) -> results` returns an embedding or a ValueError
+    per crop. Each batch is committed with the affected templates, and the
+    shared status file is updated for progress reporting. Crops that fail
+    are skipped for this run and retried on the next one. Call with the
+    lock from try_lock() held. Database and index work runs in the threadpool.
+    """
+    status = {
+        "state": "running",
+        "model": f"{FACE_MODEL} v{FACE_MODEL_VERSION}",
+        "done": 0,
+        "failed": 0,
+        "total": None,
+        "started_at": datetime.utcnow().isoformat(),
+        "finished_at": None,
+        "error": None,
+    }
+    _write_status(status)
+    failed = set()
+    try:
+        status["total"] = await run_in_threadpool(lambda: pending_crops(db).count())
+        _write_status(status)
+        while True:
+            batch = await run_in_threadpool(_next_batch, db, failed)
+            if not batch:
+                break
+
+            results = await embed([row.content_hash for row in batch])
+            by_student = {}
+            for row, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    failed.add(row.content_hash)
+                else:
+                    by_student.setdefault(row.student_id, []).append((row.content_hash, result))
+            await run_in_threadpool(_write_batch, db, by_student)
+
+            status["done"] += len(batch) - sum(1 for row in batch if row.content_hash in failed)
+            status["failed"] = len(failed)
+            _write_status(status)
+
+        await run_in_threadpool(rebuild_index, db)
+        status["state"] = "finished"
+    except Exception as e:
+        db.rollback()
+        status.update({"state": "failed", "error": str(e)})
+        raise
+    finally:
+        status["finished_at"] = datetime.utcnow().isoformat()
+        _write_status(status)
+    return status
@@ -0,0 +1,88 @@
+from itertools import count
+import os
+
+# ------------------------------------------------------------
+# TRACKING CONFIGURATION
+# ------------------------------------------------------------
+# Minimum box overlap for a face to count as the same face as last frame
+TRACK_IOU_THRESHOLD = float(os.getenv("TRACK_IOU_THRESHOLD", "0.4"))
+# Frames a face may be missing before its track is dropped
+TRACK_MAX_MISSED = int(os.getenv("TRACK_MAX_MISSED", "10"))
+
+
+def iou(a: dict, b: dict) -> float:
+    """Intersection-over-union of two {x, y, w, h} boxes."""
+    x1, y1 = max(a["x"], b["x"]), max(a["y"], b["y"])
+    x2 = min(a["x"] + a["w"], b["x"] + b["w"])
+    y2 = min(a["y"] + a["h"], b["y"] + b["h"])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = a["w"] * a["h"] + b["w"] * b["h"] - inter
+    return inter / union if union else 0.0
+
+
+def overlaps_any(box: dict, boxes: list[dict], threshold: float = TRACK_IOU_THRESHOLD) -> bool:
+    return any(iou(box, other) >= threshold for other in boxes)
+
+
+class Track:
+    def __init__(self, track_id: int, box: dict):
+        self.track_id = track_id
+        self.box = box
+        self.student_id = None
+        self.distance = None
+        self.attempts = 0  # embeddings tried without a match
+        self.missed = 0
+
+
+class FaceTracker:
+    """
+    Follows faces across the frames of one stream by box overlap, so a face
+    that has already been identified is not embedded again on every frame.
+    """
+
+    def __init__(self, iou_threshold: float = TRACK_IOU_THRESHOLD, max_missed: int = TRACK_MAX_MISSED):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.tracks = {}
+        self._ids = count(1)
+
+    def settled_boxes(self, max_attempts: int) -> list[dict]:
+        """Boxes needing no more embedding: identified, or still unknown after `max_attempts` tries."""
+        return [t.box for t in self.tracks.values() if t.student_id is not None or t.attempts >= max_attempts]
+
+    def update(self, boxes: list[dict]) -> list[Track]:
+        """
+        Associate this frame's boxes with existing tracks (greedy, best overlap
+        first) and start new tracks for the rest. Returns one track per box.
+        """
+        pairs = sorted(
+            (
+                (iou(box, track.box), i, track_id)
+                for i, box in enumerate(boxes)
+                for track_id, track in self.tracks.items()
+            ),
+            reverse=True,
+        )
+        assigned, used = {}, set()
+        for overlap, i, track_id in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if i not in assigned and track_id not in used:
+                assigned[i] = self.tracks[track_id]
+                used.add(track_id)
+
+        for track_id in list(self.tracks):
+            if track_id not in used:
+                self.tracks[track_id].missed += 1
+                if self.tracks[track_id].missed > self.max_missed:
+                    del self.tracks[track_id]
+
+        result = []
+        for i, box in enumerate(boxes):
+            track = assigned.get(i)
+            if track is None:
+                track = Track(next(self._ids), box)
+                self.tracks[track.track_id] = track
+            track.box, track.missed = box, 0
+            result.append(track)
+        return result
@@ -1,35 +1,48 @@
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import and_, delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from passlib.context import CryptContext
-from app.database import SessionLocal
+from app.database import get_async_db
 from app.models import Students, Lecturers, Courses, Attendance, Faculties
 from app.auth_utils import get_current_user
+from app.attendance_writes import upsert_attendance
+from app.rollups import record_changes
+from app.pagination import PageParams, paginate
 from datetime import datetime, date, time
 
 router = APIRouter()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# ----------------------------
-# DB Session Dependency
-# ----------------------------
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
+# Columns admins see; password hashes are never returned
+STUDENT_COLUMNS = (
+    Students.student_id,
+    Students.student_name,
+    Students.reg_number,
+    Students.email,
+    Students.year_of_study,
+    Students.faculty_id,
+    Students.image_path,
+)
+LECTURER_COLUMNS = (
+    Lecturers.lecturer_id,
+    Lecturers.lecturer_name,
+    Lecturers.email,
+    Lecturers.department,
+    Lecturers.faculty_id,
+    Lecturers.is_admin,
+)
 
 # ----------------------------
 # Utility: Verify admin privileges
 # ----------------------------
-def verify_admin(user: dict, db: Session):
+async def verify_admin(user: dict, db: AsyncSession):
     """
     Ensures the current user is a lecturer with admin privileges.
     """
-    lecturer = db.query(Lecturers).filter(Lecturers.email == user["email"]).first()
-    if not lecturer or not lecturer.is_admin:
+    is_admin = await db.scalar(select(Lecturers.is_admin).where(Lecturers.email == user["email"]))
+    if not is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Admin privileges required",
@@ -40,27 +53,38 @@ def verify_admin(user: dict, db: Session):
 # 1️⃣ View All Students
 # ----------------------------
 @router.get("/students", tags=["Admin"])
-def list_students(db: Session = Depends(get_db), user: dict = Depends(get_current_user)):
-    verify_admin(user, db)
-    students = db.query(Students).all()
-    return {"total_students": len(students), "students": students}
+async def list_students(
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    user: dict = Depends(get_current_user),
+):
+    """
+    Students in student_id order, one page at a time (pass `next_cursor` as
+    `after`), or all of them with `format=ndjson`. Never includes password hashes.
+    """
+    await verify_admin(user, db)
+    return await paginate(db, select(*STUDENT_COLUMNS), Students.student_id, page, "students")
 
 
 # ----------------------------
 # 2️⃣ View All Lecturers
 # ----------------------------
 @router.get("/lecturers", tags=["Admin"])
-def list_lecturers(db: Session = Depends(get_db), user: dict = Depends(get_current_user)):
-    verify_admin(user, db)
-    lecturers = db.query(Lecturers).all()
-    return {"total_lecturers": len(lecturers), "lecturers": lecturers}
+async def list_lecturers(
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    user: dict = Depends(get_current_user),
+):
+    """Lecturers in lecturer_id order, paged like /admin/students."""
+    await verify_admin(user, db)
+    return await paginate(db, select(*LECTURER_COLUMNS), Lecturers.lecturer_id, page, "lecturers")
 
 
 # ----------------------------
 # 3️⃣ Create a New Student
 # ----------------------------
 @router.post("/create-student", tags=["Admin"])
-def create_student(
+async def create_student(
     student_name: str,
     reg_number: str,
     email: str,
@@ -68,32 +92,32 @@ def create_student(
     faculty_id: int,
     password: str,
     image_path: str = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user: dict = Depends(get_current_user),
 ):
-    verify_admin(user, db)
+    await verify_admin(user, db)
 
     # Check for duplicate
-    if db.query(Students).filter(
+    if await db.scalar(select(Students.student_id).where(
         (Students.email == email) | (Students.reg_number == reg_number)
-    ).first():
+    )):
         raise HTTPException(
             status_code=400, detail="Email or registration number already exists"
         )
 
-    hashed_password = pwd_context.hash(password)
-    new_student = Students(
-        student_name=student_name,
-        reg_number=reg_number,
-        email=email,
-        year_of_study=year_of_study,
-        faculty_id=faculty_id,
-        image_path=image_path,
-        password_hash=hashed_password,
-    )
-    db.add(new_student)
-    db.commit()
-    db.refresh(new_student)
+    hashed_password = await run_in_threadpool(pwd_context.hash, password)
+    new_student = (await db.execute(
+        insert(Students).values(
+            student_name=student_name,
+            reg_number=reg_number,
+            email=email,
+            year_of_study=year_of_study,
+            faculty_id=faculty_id,
+            image_path=image_path,
+            password_hash=hashed_password,
+        ).returning(*STUDENT_COLUMNS)
+    )).mappings().one()
+    await db.commit()
     return {"message": "✅ Student created successfully", "student": new_student}
 
 
@@ -101,33 +125,33 @@ def create_student(
 # 4️⃣ Create a New Lecturer
 # ----------------------------
 @router.post("/create-lecturer", tags=["Admin"])
-def create_lecturer(
+async def create_lecturer(
     lecturer_name: str,
     email: str,
     department: str,
     faculty_id: int,
     password: str,
     is_admin: bool = False,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user: dict = Depends(get_current_user),
 ):
-    verify_admin(user, db)
+    await verify_admin(user, db)
 
-    if db.query(Lecturers).filter(Lecturers.email == email).first():
+    if await db.scalar(select(Lecturers.lecturer_id).where(Lecturers.email == email)):
         raise HTTPException(status_code=400, detail="Email already exists")
 
-    hashed_password = pwd_context.hash(password)
-    new_lecturer = Lecturers(
-        lecturer_name=lecturer_name,
-        email=email,
-        department=department,
-        faculty_id=faculty_id,
-        password_hash=hashed_password,
-        is_admin=is_admin,
-    )
-    db.add(new_lecturer)
-    db.commit()
-    db.refresh(new_lecturer)
+    hashed_password = await run_in_threadpool(pwd_context.hash, password)
+    new_lecturer = (await db.execute(
+        insert(Lecturers).values(
+            lecturer_name=lecturer_name,
+            email=email,
+            department=department,
+            faculty_id=faculty_id,
+            password_hash=hashed_password,
+            is_admin=is_admin,
+        ).returning(*LECTURER_COLUMNS)
+    )).mappings().one()
+    await db.commit()
 
     return {"message": "✅ Lecturer created successfully", "lecturer": new_lecturer}
 
@@ -136,107 +160,147 @@ def create_lecturer(
 # 5️⃣ Attendance Summary
 # ----------------------------
 @router.get("/attendance-summary", tags=["Admin"])
-def attendance_summary(db: Session = Depends(get_db), user: dict = Depends(get_current_user)):
-    verify_admin(user, db)
-
-    results = (
-        db.query(
-            Courses.course_name,
-            Courses.course_code,
-            Faculties.faculty_name,
-        )
-        .join(Faculties, Courses.faculty_id == Faculties.faculty_id)
-        .all()
+async def attendance_summary(
+    start_date: date = None,
+    end_date: date = None,
+    faculty_id: int = None,
+    lecturer_id: int = None,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_async_db),
+    user: dict = Depends(get_current_user),
+):
+    """
+    📊 Attendance counts per course, optionally limited to a date range,
+    faculty or lecturer. Courses are paged by course code, and each page is
+    counted in one grouped query, so the cost does not grow with the number
+    of courses.
+    """
+    await verify_admin(user, db)
+
+    courses = select(
+        Courses.course_id,
+        Courses.course_name,
+        Courses.course_code,
+        Faculties.faculty_name,
+    ).join(Faculties, Courses.faculty_id == Faculties.faculty_id)
+    if faculty_id is not None:
+        courses = courses.where(Courses.faculty_id == faculty_id)
+    if lecturer_id is not None:
+        courses = courses.where(Courses.lecturer_id == lecturer_id)
+
+    total_courses = await db.scalar(select(func.count()).select_from(courses.subquery()))
+    page_courses = (
+        courses.order_by(Courses.course_code)
+        .offset((page - 1) * page_size)
+        .limit(page_size)
+        .subquery()
     )
 
-    summary = []
-    for course_name, course_code, faculty_name in results:
-        total_records = (
-            db.query(Attendance)
-            .join(Courses)
-            .filter(Courses.course_code == course_code)
-            .count()
-        )
-        present = (
-            db.query(Attendance)
-            .join(Courses)
-            .filter(
-                Courses.course_code == course_code, Attendance.status == "Present"
-            )
-            .count()
-        )
-        late = (
-            db.query(Attendance)
-            .join(Courses)
-            .filter(Courses.course_code == course_code, Attendance.status == "Late")
-            .count()
+    # Date filters go in the join so courses without records still show up with zeros
+    joined = [Attendance.course_id == page_courses.c.course_id]
+    if start_date is not None:
+        joined.append(Attendance.date >= start_date)
+    if end_date is not None:
+        joined.append(Attendance.date <= end_date)
+
+    records = func.count(Attendance.attendance_id)
+    counts = (
+        select(
+            page_courses.c.course_name,
+            page_courses.c.course_code,
+            page_courses.c.faculty_name,
+            records.label("total_records"),
+            records.filter(Attendance.status == "Present").label("present"),
+            records.filter(Attendance.status == "Late").label("late"),
+            records.filter(Attendance.status == "Absent").label("absent"),
         )
-        absent = (
-            db.query(Attendance)
-            .join(Courses)
-            .filter(Courses.course_code == course_code, Attendance.status == "Absent")
-            .count()
+        .select_from(page_courses)
+        .outerjoin(Attendance, and_(*joined))
+        .group_by(
+            page_courses.c.course_id,
+            page_courses.c.course_name,
+            page_courses.c.course_code,
+            page_courses.c.faculty_name,
         )
+        .order_by(page_courses.c.course_code)
+    )
+    results = (await db.execute(counts)).all()
 
-        summary.append(
-            {
-                "course_name": course_name,
-                "course_code": course_code,
-                "faculty_name": faculty_name,
-                "total_records": total_records,
-                "present": present,
-                "late": late,
-                "absent": absent,
-                "attendance_rate": round(
-                    ((present + late) / total_records * 100) if total_records else 0, 2
-                ),
-            }
-        )
-    return {"summary": summary}
+    summary = [
+        {
+            "course_name": row.course_name,
+            "course_code": row.course_code,
+            "faculty_name": row.faculty_name,
+            "total_records": row.total_records,
+            "present": row.present,
+            "late": row.late,
+            "absent": row.absent,
+            "attendance_rate": round(
+                ((row.present + row.late) / row.total_records * 100) if row.total_records else 0, 2
+            ),
+        }
+        for row in results
+    ]
+    return {
+        "summary": summary,
+        "page": page,
+        "page_size": page_size,
+        "total_courses": total_courses,
+    }
 
 
 # ----------------------------
 # 6️⃣ Add / Delete Attendance (Admin Control)
 # ----------------------------
 @router.post("/attendance/add", tags=["Admin"])
-def add_attendance(
+async def add_attendance(
     student_id: int,
     course_id: int,
     status: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user: dict = Depends(get_current_user),
 ):
-    verify_admin(user, db)
-
-    record = Attendance(
-        student_id=student_id,
-        course_id=course_id,
-        date=date.today(),
-        time_in=datetime.now().time(),
-        status=status,
-        recognized_face=False,
-        verified_by_admin=True,
+    await verify_admin(user, db)
+
+    record = {
+        "student_id": student_id,
+        "course_id": course_id,
+        "date": date.today(),
+        "time_in": datetime.now().time(),
+        "status": status,
+        "recognized_face": False,
+        "verified_by_admin": True,
+    }
+    # An existing record for today is corrected instead of duplicated
+    [(attendance_id, _, inserted)] = await db.run_sync(
+        upsert_attendance, [record], update=("status", "verified_by_admin")
     )
-    db.add(record)
-    db.commit()
-    db.refresh(record)
+    await db.commit()
 
-    return {"message": "✅ Attendance added manually", "data": record}
+    return {
+        "message": "✅ Attendance added manually" if inserted else "✅ Attendance updated manually",
+        "data": {"attendance_id": attendance_id, **record},
+    }
 
 
 @router.delete("/attendance/delete/{attendance_id}", tags=["Admin"])
-def delete_attendance(
+async def delete_attendance(
     attendance_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user: dict = Depends(get_current_user),
 ):
-    verify_admin(user, db)
-    record = (
-        db.query(Attendance).filter(Attendance.attendance_id == attendance_id).first()
-    )
-    if not record:
+    await verify_admin(user, db)
+    # RETURNING gives the row exactly as it was deleted, so a status change
+    # committed after an earlier read cannot leave the rollups off by one
+    deleted = (await db.execute(
+        delete(Attendance).where(Attendance.attendance_id == attendance_id).returning(
+            Attendance.student_id, Attendance.course_id, Attendance.date, Attendance.status
+        )
+    )).first()
+    if not deleted:
         raise HTTPException(status_code=404, detail="Attendance record not found")
 
-    db.delete(record)
-    db.commit()
+    await db.run_sync(record_changes, removed=[tuple(deleted)])
+    await db.commit()
     return {"message": "🗑️ Attendance record deleted successfully"}
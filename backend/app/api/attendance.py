@@ -1,62 +1,148 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
-from app.models import Attendance, Students, Courses
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
+from app.models import Attendance, StudentCourse, Students
 from app.auth_utils import get_current_user
+from app.attendance_writes import upsert_attendance
+from app.pagination import PageParams, paginate
+from datetime import date, datetime
+from typing import Literal
 
 router = APIRouter()
 
-# Dependency: database session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+FOREIGN_KEY_VIOLATION = "23503"  # Postgres SQLSTATE
+
+# Most students marked in one roster request
+ROSTER_MAX_ENTRIES = 1000
+
+
+class RosterEntry(BaseModel):
+    student_id: int
+    status: Literal["Present", "Late", "Absent"]
+
+
+class RosterMarks(BaseModel):
+    course_id: int
+    session_date: date | None = None  # defaults to today
+    entries: list[RosterEntry]
+
 
 # ----------------------------
 # Protected endpoint for marking attendance (lecturer only)
 # ----------------------------
 @router.post("/mark")
-def mark_attendance(
+async def mark_attendance(
     student_id: int,
     course_id: int,
     status: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user: dict = Depends(get_current_user),
 ):
     # Role-based restriction
     if user["role"] != "lecturer":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied: Lecturer only")
 
-    # Check if student & course exist
-    student = db.query(Students).filter(Students.student_id == student_id).first()
-    course = db.query(Courses).filter(Courses.course_id == course_id).first()
+    # Marking again on the same day updates the existing record. A missing
+    # student or course shows up as a foreign key violation, saving two lookups.
+    try:
+        [(attendance_id, _, _)] = await db.run_sync(upsert_attendance, [{
+            "student_id": student_id,
+            "course_id": course_id,
+            "date": date.today(),
+            "time_in": datetime.now().time(),
+            "status": status,
+        }])
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if getattr(e.orig, "pgcode", None) == FOREIGN_KEY_VIOLATION:
+            raise HTTPException(status_code=404, detail="Student or Course not found")
+        raise HTTPException(status_code=400, detail="Invalid attendance status")
+    return {"message": "Attendance marked successfully", "attendance_id": attendance_id}
+
+
+# ----------------------------
+# Mark a whole class roster at once (lecturer only)
+# ----------------------------
+@router.post("/mark-roster")
+async def mark_roster(
+    roster: RosterMarks,
+    db: AsyncSession = Depends(get_async_db),
+    user: dict = Depends(get_current_user),
+):
+    """
+    ✅ Attendance for one course session in a single request: one query
+    checks enrollment for every student, one upsert writes all rows.
+    Students not enrolled in the course are skipped and listed.
+    """
+    if user["role"] != "lecturer":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied: Lecturer only")
+    if len(roster.entries) > ROSTER_MAX_ENTRIES:
+        raise HTTPException(status_code=413, detail=f"At most {ROSTER_MAX_ENTRIES} students per request")
+
+    enrolled = set((await db.scalars(
+        select(StudentCourse.student_id).where(
+            StudentCourse.course_id == roster.course_id,
+            StudentCourse.student_id.in_({entry.student_id for entry in roster.entries}),
+        )
+    )).all())
 
-    if not student or not course:
-        raise HTTPException(status_code=404, detail="Student or Course not found")
+    session_date = roster.session_date or date.today()
+    # Arrival time is only known when marking a class that is happening now
+    now = datetime.now().time() if session_date == date.today() else None
+    rows = [
+        {
+            "student_id": entry.student_id,
+            "course_id": roster.course_id,
+            "date": session_date,
+            "time_in": None if entry.status == "Absent" else now,
+            "status": entry.status,
+        }
+        for entry in roster.entries
+        if entry.student_id in enrolled
+    ]
+    written = await db.run_sync(upsert_attendance, rows)
+    await db.commit()
 
-    attendance = Attendance(student_id=student_id, course_id=course_id, status=status)
-    db.add(attendance)
-    db.commit()
-    db.refresh(attendance)
-    return {"message": "Attendance marked successfully", "attendance_id": attendance.attendance_id}
+    inserted = sum(1 for _, _, is_new in written if is_new)
+    return {
+        "message": f"✅ Attendance marked for {len(written)} students",
+        "course_id": roster.course_id,
+        "date": session_date,
+        "inserted": inserted,
+        "updated": len(written) - inserted,
+        "not_enrolled": sorted({entry.student_id for entry in roster.entries} - enrolled),
+    }
 
 
 # ----------------------------
 # Protected endpoint for viewing attendance (student only)
 # ----------------------------
 @router.get("/my-attendance")
-def view_my_attendance(
-    db: Session = Depends(get_db),
+async def view_my_attendance(
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
     user: dict = Depends(get_current_user),
 ):
     if user["role"] != "student":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied: Students only")
 
-    student = db.query(Students).filter(Students.email == user["sub"]).first()
-    if not student:
+    student_id = await db.scalar(select(Students.student_id).where(Students.email == user["sub"]))
+    if student_id is None:
         raise HTTPException(status_code=404, detail="Student record not found")
 
-    attendance_records = db.query(Attendance).filter(Attendance.student_id == student.student_id).all()
-    return {"email": user["sub"], "records": attendance_records}
+    # Paged by attendance_id (pass `next_cursor` as `after`); `format=ndjson` exports all
+    records = select(
+        Attendance.attendance_id,
+        Attendance.course_id,
+        Attendance.date,
+        Attendance.time_in,
+        Attendance.time_out,
+        Attendance.status,
+        Attendance.recognized_face,
+        Attendance.verified_by_admin,
+    ).where(Attendance.student_id == student_id)
+    return await paginate(db, records, Attendance.attendance_id, page, "records", email=user["sub"])
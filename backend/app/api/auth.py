@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials  # ✅ Added
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from passlib.context import CryptContext
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
-from app.database import SessionLocal
+from app.database import get_async_db
 from app.models import Lecturers, Students
 import os
 
@@ -26,14 +28,6 @@ class LoginRequest(BaseModel):
     password: str
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -46,18 +40,19 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
 
 
 @router.post("/login", tags=["Authentication"])
-def login(request: LoginRequest, db: Session = Depends(get_db)):
+async def login(request: LoginRequest, db: AsyncSession = Depends(get_async_db)):
     # Try lecturer first
-    user = db.query(Lecturers).filter(Lecturers.email == request.email).first()
+    user = await db.scalar(select(Lecturers).where(Lecturers.email == request.email))
 
     # If not found, try student
     if not user:
-        user = db.query(Students).filter(Students.email == request.email).first()
+        user = await db.scalar(select(Students).where(Students.email == request.email))
 
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-    if not verify_password(request.password, user.password_hash):
+    # bcrypt is deliberately slow; keep it off the event loop
+    if not await run_in_threadpool(verify_password, request.password, user.password_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
 
     role = "lecturer" if hasattr(user, "lecturer_id") else "student"
@@ -1,21 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.models import Students, Courses, StudentCourse
 from app.auth_utils import get_current_user
+from app.ai.gallery import refresh_course_gallery
+from app.pagination import PageParams, paginate
 
 router = APIRouter()
 
-# ----------------------------
-# DB Dependency
-# ----------------------------
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # ----------------------------
 # Verify admin privileges
 # ----------------------------
@@ -30,19 +23,19 @@ def verify_admin(user: dict):
 # Enroll a Student in a Course
 # ----------------------------
 @router.post("/enroll", tags=["Enrollment"])
-def enroll_student(
+async def enroll_student(
     student_id: int,
     course_id: int,
     semester: str,
     year: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user: dict = Depends(get_current_user)
 ):
     verify_admin(user)
 
     # Ensure student and course exist
-    student = db.query(Students).filter(Students.student_id == student_id).first()
-    course = db.query(Courses).filter(Courses.course_id == course_id).first()
+    student = await db.get(Students, student_id)
+    course = await db.get(Courses, course_id)
 
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
@@ -50,10 +43,8 @@ def enroll_student(
         raise HTTPException(status_code=404, detail="Course not found")
 
     # Prevent duplicate enrollment
-    existing = (
-        db.query(StudentCourse)
-        .filter(StudentCourse.student_id == student_id, StudentCourse.course_id == course_id)
-        .first()
+    existing = await db.scalar(
+        select(StudentCourse.id).where(StudentCourse.student_id == student_id, StudentCourse.course_id == course_id)
     )
     if existing:
         raise HTTPException(status_code=400, detail="Student already enrolled in this course")
@@ -67,8 +58,10 @@ def enroll_student(
     )
 
     db.add(enrollment)
-    db.commit()
-    db.refresh(enrollment)
+    await db.commit()
+
+    # Roster changed, so the course's recognition gallery must include the new student
+    await db.run_sync(refresh_course_gallery, course_id)
 
     return {
         "message": "✅ Student enrolled successfully",
@@ -82,21 +75,23 @@ def enroll_student(
 # View All Enrollments
 # ----------------------------
 @router.get("/list", tags=["Enrollment"])
-def list_enrollments(db: Session = Depends(get_db), user: dict = Depends(get_current_user)):
+async def list_enrollments(
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    user: dict = Depends(get_current_user),
+):
     verify_admin(user)
 
+    # Paged by enrollment id (pass `next_cursor` as `after`); `format=ndjson` exports all
     enrollments = (
-        db.query(StudentCourse)
-        .join(Students)
-        .join(Courses)
-        .with_entities(
+        select(
             StudentCourse.id,
             Students.student_name,
             Courses.course_name,
             StudentCourse.semester,
             StudentCourse.year
         )
-        .all()
+        .join(Students)
+        .join(Courses)
     )
-
-    return {"total_enrollments": len(enrollments), "enrollments": enrollments}
+    return await paginate(db, enrollments, StudentCourse.id, page, "enrollments")
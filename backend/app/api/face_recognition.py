@@ -1,25 +1,132 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Header, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from deepface import DeepFace
-from app.database import SessionLocal
-from app.models import Students, Attendance
-from app.auth_utils import get_current_user  # ✅ Added
+from pydantic import BaseModel
+from app.database import SessionLocal, get_db
+from app.models import Courses, StudentCourse, Students
+from app.auth_utils import decode_token, get_current_user  # ✅ Added
+from app.attendance_writes import upsert_attendance
+from app.ai.audit_log import FAILED, RECOGNIZED, audit_log
+from app.ai.face_embeddings import FACE_MODEL, FACE_MODEL_VERSION, MATCH_THRESHOLD, load_embeddings
+from app.ai.gallery import get_course_gallery, get_index, index_info, search
+from app.ai.frame_cache import frame_cache
+from app.ai.inference_pool import embed_classroom_image, embed_probe, embed_stream_frame, inference_pool, probe_batcher
+from app.ai.tracking import FaceTracker
 from datetime import datetime
-import cv2
+import base64
+import hashlib
 import numpy as np
-import os
+import time
 
 router = APIRouter()
 
-# ----------------------------
-# Database Dependency
-# ----------------------------
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Number of nearest candidates reported alongside the winner
+TOP_K = 5
+
+# Failed embeddings of a streamed face before it is reported as unknown
+STREAM_UNKNOWN_AFTER = 3
+
+# Most attendance events accepted from a kiosk in one sync request
+KIOSK_SYNC_MAX_EVENTS = 500
+
+
+class KioskEvent(BaseModel):
+    event_id: str
+    student_id: int
+    course_id: int
+    seen_at: datetime
+    distance: float
+
+
+class KioskSync(BaseModel):
+    events: list[KioskEvent]
+
+def _elapsed_ms(started: float) -> float:
+    return (time.perf_counter() - started) * 1000
+
+
+def _is_match(candidates) -> bool:
+    return bool(candidates) and candidates[0][1] < MATCH_THRESHOLD  # lower = closer match
+
+
+def _require_course(db: Session, course_id: int):
+    """404 for an unknown course, before any attendance or audit row references it."""
+    if course_id is not None and db.query(Courses.course_id).filter(Courses.course_id == course_id).first() is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+
+
+def _mark_present(db: Session, student_ids: list[int], course_id: int, seen_at: dict = None):
+    """
+    Mark students present with one upsert: a new row for each student not
+    yet recorded that day, status set to Present on existing rows. `seen_at`
+    maps student ids to when they were seen, all on one day (default now).
+    The caller commits.
+    """
+    now = datetime.now()
+    seen_at = seen_at or {}
+    today = next(iter(seen_at.values()), now).date()
+    upsert_attendance(db, [
+        {
+            "student_id": student_id,
+            "course_id": course_id,
+            "date": today,
+            "time_in": seen_at.get(student_id, now).time(),
+            "status": "Present",
+            "recognized_face": True,
+        }
+        for student_id in student_ids
+    ])
+
+
+def _mark_batch(db: Session, student_ids: list[int], course_id: int):
+    """
+    Mark the students that still exist present and commit. Returns their
+    (student_id, student_name, email) rows.
+    """
+    students = db.query(Students.student_id, Students.student_name, Students.email).filter(
+        Students.student_id.in_(student_ids)
+    ).all()
+    if students:
+        _mark_present(db, [student.student_id for student in students], course_id)
+        db.commit()
+    return students
+
+
+# Database and index work of the async endpoints below runs through these
+# helpers in the threadpool, so a gallery reload or a commit never holds up
+# other requests on the event loop.
+def _search_probe(db: Session, probe: np.ndarray, course_id: int, allow_walk_ins: bool, exact: bool):
+    """Search the course roster first; the whole index only for walk-ins. Returns (candidates, scope)."""
+    candidates, scope = [], "course"
+    if course_id is not None:
+        candidates = get_course_gallery(db, course_id).search(probe, k=TOP_K)
+
+    if course_id is None or (allow_walk_ins and not _is_match(candidates)):
+        index = get_index(db)
+        if not len(index):
+            raise HTTPException(status_code=404, detail="No registered faces found")
+        # exact=True bypasses the ANN index
+        candidates, scope = search(index, probe, TOP_K, exact=exact), "global"
+    return candidates, scope
+
+
+def _match_classroom(db: Session, embeddings: np.ndarray, course_id: int, allow_walk_ins: bool):
+    """Best roster match per face, walk-ins from the whole index if allowed; each student matches at most one face."""
+    # One matrix product for all faces
+    matches = get_course_gallery(db, course_id).match_many(embeddings, MATCH_THRESHOLD)
+
+    if allow_walk_ins and None in matches:
+        index = get_index(db)
+        matched_ids = {match[0] for match in matches if match}
+        for i, match in enumerate(matches):
+            if match is None and len(index):
+                candidates = index.search(embeddings[i], k=1)
+                if _is_match(candidates) and candidates[0][0] not in matched_ids:
+                    matches[i] = candidates[0]
+                    matched_ids.add(candidates[0][0])
+    return matches
+
 
 # ----------------------------
 # FACE RECOGNITION ENDPOINT
@@ -28,67 +135,45 @@ def get_db():
 async def recognize_face(
     file: UploadFile = File(...),
     course_id: int = None,
+    allow_walk_ins: bool = False,
+    exact: bool = False,
     db: Session = Depends(get_db),
     user: dict = Depends(get_current_user)  # ✅ Require login
 ):
+    await run_in_threadpool(_require_course, db, course_id)
+    started, candidates = time.perf_counter(), []
     try:
         # Read uploaded image
         image_data = await file.read()
-        np_image = np.frombuffer(image_data, np.uint8)
-        frame = cv2.imdecode(np_image, cv2.IMREAD_COLOR)
 
-        # Define faces folder
-        known_faces_folder = "faces"
-        if not os.path.exists(known_faces_folder):
-            raise HTTPException(status_code=404, detail="No registered faces found")
-
-        best_match = None
-        highest_similarity = 0
+        # Decode + embed only the probe frame, off the event loop and
+        # batched with other requests arriving at the same moment; a
+        # near-duplicate of a recent frame from the same client and course
+        # reuses its embedding
+        try:
+            probe = await embed_probe(image_data, scope=(user["sub"], course_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid or unreadable image")
+        if probe is None:
+            raise HTTPException(status_code=400, detail="No face detected in the uploaded image")
 
-        # Loop through stored faces
-        for student in db.query(Students).filter(Students.image_path.isnot(None)).all():
-            if not os.path.exists(student.image_path):
-                continue
+        candidates, scope = await run_in_threadpool(_search_probe, db, probe, course_id, allow_walk_ins, exact)
 
-            try:
-                result = DeepFace.verify(frame, student.image_path, model_name="VGG-Face", enforce_detection=False)
-                similarity = result.get("distance", 1)
-                if similarity < 0.4:  # lower = closer match
-                    best_match = student
-                    highest_similarity = 1 - similarity
-                    break
-            except Exception:
-                continue
+        best_match = None
+        if _is_match(candidates):
+            best_match_id, best_distance = candidates[0]
+            highest_similarity = 1 - best_distance
+            # Record attendance; nothing comes back for a student deleted meanwhile
+            best_match = next(iter(await run_in_threadpool(_mark_batch, db, [best_match_id], course_id)), None)
 
         if not best_match:
             raise HTTPException(status_code=404, detail="No face match found")
 
-        # Record attendance
-        existing_record = (
-            db.query(Attendance)
-            .filter(
-                Attendance.student_id == best_match.student_id,
-                Attendance.course_id == course_id,
-                Attendance.date == datetime.now().date()
-            )
-            .first()
+        audit_log.record(
+            RECOGNIZED, "recognize-face", best_match.student_id, course_id,
+            distance=best_distance, latency_ms=_elapsed_ms(started),
         )
 
-        if existing_record:
-            existing_record.status = "Present"
-        else:
-            new_record = Attendance(
-                student_id=best_match.student_id,
-                course_id=course_id,
-                date=datetime.now().date(),
-                time_in=datetime.now().time(),
-                status="Present",
-                recognized_face=True
-            )
-            db.add(new_record)
-
-        db.commit()
-
         return {
             "message": "✅ Face recognized successfully",
             "student": {
@@ -96,8 +181,295 @@ async def recognize_face(
                 "name": best_match.student_name,
                 "email": best_match.email
             },
-            "confidence": round(highest_similarity, 2)
+            "confidence": round(highest_similarity, 2),
+            "scope": scope,
+            "candidates": [
+                {"student_id": student_id, "distance": round(distance, 4)}
+                for student_id, distance in candidates
+            ],
+        }
+
+    except HTTPException as e:
+        audit_log.record(
+            FAILED, "recognize-face", course_id=course_id,
+            distance=candidates[0][1] if candidates else None,
+            latency_ms=_elapsed_ms(started), reason=e.detail,
+        )
+        raise
+    except Exception as e:
+        audit_log.record(FAILED, "recognize-face", course_id=course_id, latency_ms=_elapsed_ms(started), reason=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ----------------------------
+# CLASSROOM SNAPSHOT ENDPOINT
+# ----------------------------
+@router.post("/recognize-classroom", tags=["Facial Recognition"])
+async def recognize_classroom(
+    course_id: int,
+    file: UploadFile = File(...),
+    allow_walk_ins: bool = False,
+    db: Session = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """
+    🏫 Upload one wide photo of the room: every face is detected and embedded
+    in one batch, matched against the course roster, and all recognized
+    students are marked present in a single transaction.
+    """
+    await run_in_threadpool(_require_course, db, course_id)
+    started = time.perf_counter()
+    try:
+        image_data = await file.read()
+        try:
+            boxes, embeddings = await inference_pool.run(embed_classroom_image, image_data)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid or unreadable image")
+
+        matches = await run_in_threadpool(_match_classroom, db, embeddings, course_id, allow_walk_ins)
+
+        recognized = {match[0]: (box, match[1]) for box, match in zip(boxes, matches) if match}
+        unrecognized = [box for box, match in zip(boxes, matches) if match is None]
+
+        students = []
+        if recognized:
+            students = await run_in_threadpool(_mark_batch, db, list(recognized), course_id)
+
+        latency_ms = _elapsed_ms(started)
+        for student_id, (_, distance) in recognized.items():
+            audit_log.record(RECOGNIZED, "recognize-classroom", student_id, course_id, distance=distance, latency_ms=latency_ms)
+        for _ in unrecognized:
+            audit_log.record(FAILED, "recognize-classroom", course_id=course_id, latency_ms=latency_ms, reason="No face match found")
+        if not boxes:
+            audit_log.record(FAILED, "recognize-classroom", course_id=course_id, latency_ms=latency_ms, reason="No face detected")
+
+        return {
+            "message": f"✅ {len(students)} of {len(boxes)} faces recognized",
+            "faces_detected": len(boxes),
+            "recognized": [
+                {
+                    "id": student.student_id,
+                    "name": student.student_name,
+                    "confidence": round(1 - recognized[student.student_id][1], 2),
+                    "box": recognized[student.student_id][0],
+                }
+                for student in students
+            ],
+            "unrecognized": unrecognized,
         }
 
+    except HTTPException as e:
+        audit_log.record(FAILED, "recognize-classroom", course_id=course_id, latency_ms=_elapsed_ms(started), reason=e.detail)
+        raise
     except Exception as e:
+        await run_in_threadpool(db.rollback)
+        audit_log.record(FAILED, "recognize-classroom", course_id=course_id, latency_ms=_elapsed_ms(started), reason=str(e))
         raise HTTPException(status_code=500, detail=str(e))
+
+
+# ----------------------------
+# RECOGNITION METRICS
+# ----------------------------
+@router.get("/metrics", tags=["Facial Recognition"])
+def recognition_metrics(user: dict = Depends(get_current_user)):
+    """
+    📈 Micro-batching, inference pool, frame cache, gallery index and audit log statistics, for
+    tuning FACE_BATCH_WINDOW_MS / FACE_BATCH_MAX_SIZE / FACE_POOL_SIZE / FRAME_CACHE_* / FACE_INDEX_*.
+    """
+    return {
+        "batching": probe_batcher.metrics(),
+        "pool": inference_pool.metrics(),
+        "frame_cache": frame_cache.stats(),
+        "index": index_info(),
+        "audit_log": audit_log.stats(),
+    }
+
+
+# ----------------------------
+# STREAMING RECOGNITION (WebSocket)
+# ----------------------------
+# A stream may stay open for hours, so it holds no database session: each
+# step below opens a short one in the threadpool and returns its connection.
+def _open_stream(course_id: int):
+    with SessionLocal() as db:
+        _require_course(db, course_id)
+        return get_course_gallery(db, course_id)
+
+
+def _mark_stream_batch(student_ids: list[int], course_id: int):
+    with SessionLocal() as db:
+        return _mark_batch(db, student_ids, course_id)
+
+
+@router.websocket("/stream")
+async def recognition_stream(websocket: WebSocket, token: str, course_id: int):
+    """
+    🎥 Continuous recognition for one webcam session and course.
+
+    Connect with ?token=<JWT>&course_id=<id>, then send JPEG frames as binary
+    messages. After each frame the server replies with a "frame" message
+    (send the next frame only after it arrives), plus a "recognized" or
+    "unknown" event the first time a tracked face is resolved. Faces already
+    identified are followed across frames and not embedded again.
+    """
+    try:
+        decode_token(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    tracker = FaceTracker()
+    try:
+        try:
+            gallery = await run_in_threadpool(_open_stream, course_id)
+        except HTTPException as e:
+            await websocket.send_json({"type": "error", "detail": e.detail})
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        await websocket.send_json({"type": "ready", "course_id": course_id, "gallery_size": len(gallery)})
+
+        while True:
+            frame = await websocket.receive_bytes()
+            started = time.perf_counter()
+            try:
+                # Identified faces, and faces given up on as unknown, are not embedded again
+                boxes, embeddings = await inference_pool.run(
+                    embed_stream_frame, frame, tracker.settled_boxes(STREAM_UNKNOWN_AFTER)
+                )
+            except HTTPException as e:  # pool busy
+                audit_log.record(FAILED, "stream", course_id=course_id, reason=e.detail)
+                await websocket.send_json({"type": "busy", "detail": e.detail})
+                continue
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+
+            tracks = tracker.update(boxes)
+
+            # Only faces on tracks that are not yet settled were embedded
+            pending = [
+                i for i in embeddings
+                if tracks[i].student_id is None and tracks[i].attempts < STREAM_UNKNOWN_AFTER
+            ]
+            if pending:
+                matches = gallery.match_many(np.vstack([embeddings[i] for i in pending]), MATCH_THRESHOLD)
+                latency_ms = _elapsed_ms(started)
+                recognized = {}
+                for i, match in zip(pending, matches):
+                    track = tracks[i]
+                    if match:
+                        track.student_id, track.distance = match
+                        recognized[track.student_id] = track
+                        audit_log.record(RECOGNIZED, "stream", track.student_id, course_id, distance=track.distance, latency_ms=latency_ms)
+                    else:
+                        audit_log.record(FAILED, "stream", course_id=course_id, latency_ms=latency_ms, reason="No face match found")
+                        track.attempts += 1
+                        if track.attempts == STREAM_UNKNOWN_AFTER:
+                            await websocket.send_json({"type": "unknown", "track_id": track.track_id, "box": track.box})
+
+                if recognized:
+                    students = await run_in_threadpool(_mark_stream_batch, list(recognized), course_id)
+                    for student in students:
+                        track = recognized[student.student_id]
+                        await websocket.send_json({
+                            "type": "recognized",
+                            "track_id": track.track_id,
+                            "student": {"id": student.student_id, "name": student.student_name, "email": student.email},
+                            "confidence": round(1 - track.distance, 2),
+                            "box": track.box,
+                        })
+
+            await websocket.send_json({
+                "type": "frame",
+                "faces": [
+                    {"track_id": t.track_id, "box": t.box, "student_id": t.student_id}
+                    for t in tracks
+                ],
+                "embedded": len(embeddings),
+            })
+
+    except WebSocketDisconnect:
+        pass
+
+
+# ----------------------------
+# OFFLINE KIOSKS
+# ----------------------------
+@router.get("/kiosk/gallery/{course_id}", tags=["Facial Recognition"])
+def kiosk_gallery(
+    course_id: int,
+    if_none_match: str = Header(None),
+    db: Session = Depends(get_db),
+    user: dict = Depends(get_current_user),
+):
+    """
+    🗂️ Face templates of a course's students, for a kiosk to match locally.
+    Embeddings are one base64 float32 matrix, a row per student. Send the
+    returned ETag as If-None-Match to get 304 when nothing changed.
+    """
+    if user["role"] != "lecturer":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied: Lecturer only")
+    pairs = sorted(load_embeddings(db, course_id=course_id), key=lambda pair: pair[0])
+    student_ids = [student_id for student_id, _ in pairs]
+    matrix = np.vstack([embedding for _, embedding in pairs]) if pairs else np.empty((0, 0), dtype=np.float32)
+    model = f"{FACE_MODEL} v{FACE_MODEL_VERSION}"
+
+    digest = hashlib.sha256(model.encode())
+    digest.update(np.asarray(student_ids, dtype=np.int64).tobytes())
+    digest.update(matrix.tobytes())
+    etag = f'"{digest.hexdigest()[:32]}"'
+    if if_none_match == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    names = dict(db.query(Students.student_id, Students.student_name).filter(Students.student_id.in_(student_ids)))
+    payload = {
+        "course_id": course_id,
+        "model": model,
+        "students": [{"id": student_id, "name": names.get(student_id)} for student_id in student_ids],
+        "dim": matrix.shape[1],
+        "embeddings": base64.b64encode(matrix.tobytes()).decode(),
+    }
+    return JSONResponse(payload, headers={"ETag": etag})
+
+
+@router.post("/kiosk/sync", tags=["Facial Recognition"])
+def kiosk_sync(
+    batch: KioskSync,
+    db: Session = Depends(get_db),
+    user: dict = Depends(get_current_user),
+):
+    """
+    📤 Attendance recognized by a kiosk while it may have been offline.
+    Marking present is idempotent, so a batch that is sent again after a
+    lost response changes nothing. Returns the event ids that were stored,
+    and as rejected those naming an unknown course or a student not
+    enrolled in it, so the kiosk stops resending them.
+    """
+    if user["role"] != "lecturer":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied: Lecturer only")
+    if len(batch.events) > KIOSK_SYNC_MAX_EVENTS:
+        raise HTTPException(status_code=413, detail=f"At most {KIOSK_SYNC_MAX_EVENTS} events per sync")
+
+    # An enrollment row exists only for a real student and course
+    enrolled = set(
+        db.query(StudentCourse.student_id, StudentCourse.course_id).filter(
+            StudentCourse.student_id.in_({e.student_id for e in batch.events}),
+            StudentCourse.course_id.in_({e.course_id for e in batch.events}),
+        ).distinct().tuples()
+    )
+    valid = [e for e in batch.events if (e.student_id, e.course_id) in enrolled]
+
+    # First sighting of each student, grouped by course and day
+    first_seen = {}
+    for event in sorted(valid, key=lambda e: e.seen_at):
+        seen_at = event.seen_at.astimezone().replace(tzinfo=None) if event.seen_at.tzinfo else event.seen_at
+        first_seen.setdefault((event.course_id, seen_at.date()), {}).setdefault(event.student_id, seen_at)
+    for (course_id, _), seen_at in first_seen.items():
+        _mark_present(db, list(seen_at), course_id, seen_at)
+    db.commit()
+
+    return {
+        "stored": [e.event_id for e in valid],
+        "rejected": [e.event_id for e in batch.events if (e.student_id, e.course_id) not in enrolled],
+    }
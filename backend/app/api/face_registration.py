@@ -1,23 +1,26 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from app.database import SessionLocal
+from app.database import SessionLocal, get_db
 from app.models import Students
 from app.auth_utils import get_current_user  # ✅ Added
+from app.ai.bulk_registration import bulk_register
+from app.ai.face_embeddings import FACE_MAX_IMAGES, add_face_images
+from app.ai.face_store import crop_path
+from app.ai.gallery import add_to_index
+from app.ai.inference_pool import FACE_POOL_RETRY_AFTER, embed_stored_crops, inference_pool, store_reference_images
+from app.ai.reindex import read_status, reindex, try_lock
+import asyncio
+import json
 import os
 import shutil
+import tempfile
+import zipfile
 
 router = APIRouter()
 
-# ----------------------------
-# Database dependency
-# ----------------------------
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # ----------------------------
 # Verify admin / lecturer privileges
 # ----------------------------
@@ -31,43 +34,57 @@ def verify_admin(user: dict):
 # ----------------------------
 # FACE REGISTRATION ENDPOINT
 # ----------------------------
+def _save_faces(db: Session, student: Students, accepted: list, replace: bool):
+    """Store the newest crop, the crops and the template, then update the search index. Runs in the threadpool."""
+    student.image_path = crop_path(accepted[-1][0])
+    template = add_face_images(db, student.student_id, accepted, replace=replace)
+    db.commit()
+    db.refresh(student)
+    # Keep the search index in step with the stored templates
+    add_to_index(db, student.student_id, template)
+
+
 @router.post("/register-face", tags=["Facial Recognition"])
 async def register_face(
     student_id: int = Form(...),
-    file: UploadFile = File(...),
+    files: list[UploadFile] = File(..., alias="file"),
+    replace: bool = Form(False),
     db: Session = Depends(get_db),
     user: dict = Depends(get_current_user)  # ✅ Require auth
 ):
     """
-    📸 Upload a student's face photo, save it in /faces/,
-    and update the student's image path in the database.
+    📸 Upload one or more face photos of a student (repeat the `file`
+    field). Each face is stored once as a normalized crop under its content
+    hash, and their embeddings are combined into one template per student.
+    New photos are added to those already on file unless `replace` is set.
     Accessible only by lecturers/admins.
     """
     # Verify access
     verify_admin(user)
 
+    if len(files) > FACE_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"Upload at most {FACE_MAX_IMAGES} photos at once")
+
     # Find the student
-    student = db.query(Students).filter(Students.student_id == student_id).first()
+    student = await run_in_threadpool(lambda: db.query(Students).filter(Students.student_id == student_id).first())
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
 
-    faces_dir = "faces"
-    os.makedirs(faces_dir, exist_ok=True)
-
-    # Create safe filename
-    file_ext = os.path.splitext(file.filename)[1]
-    safe_name = f"{student.student_name.replace(' ', '_').lower()}{file_ext}"
-    save_path = os.path.join(faces_dir, safe_name)
-
     try:
-        # Save uploaded image
-        with open(save_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Crop, store and embed every photo in one job and one forward pass
+        uploads = [await file.read() for file in files]
+        results = await inference_pool.run(store_reference_images, uploads)
+        accepted, rejected = [], []
+        for file, result in zip(files, results):
+            if isinstance(result, ValueError):
+                rejected.append(file.filename)
+            else:
+                accepted.append(result)
+        if not accepted:
+            raise HTTPException(status_code=400, detail="No face detected in the uploaded images")
 
-        # Update DB with image path
-        student.image_path = save_path
-        db.commit()
-        db.refresh(student)
+        # Database writes and the index update stay off the event loop
+        await run_in_threadpool(_save_faces, db, student, accepted, replace)
 
         return {
             "message": "✅ Face registered successfully",
@@ -76,8 +93,126 @@ async def register_face(
                 "name": student.student_name,
                 "email": student.email,
             },
-            "saved_path": save_path,
+            "content_hashes": [crop_hash for crop_hash, _ in accepted],
+            "rejected": rejected,
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save image: {str(e)}")
+
+
+# ----------------------------
+# BULK FACE REGISTRATION
+# ----------------------------
+def _save_upload(upload) -> str:
+    """Copy an uploaded archive to a temporary file and return its path."""
+    with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as archive:
+        shutil.copyfileobj(upload, archive)
+    return archive.name
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def _run_when_free(job, items: list) -> list:
+    """Run one chunk on the shared pool, waiting instead of failing while it is busy."""
+    while True:
+        try:
+            return await inference_pool.run(job, items)
+        except HTTPException as e:
+            if e.status_code != status.HTTP_503_SERVICE_UNAVAILABLE:
+                raise
+            await asyncio.sleep(FACE_POOL_RETRY_AFTER)
+
+
+@router.post("/bulk-register-faces", tags=["Facial Recognition"])
+async def bulk_register_faces(
+    file: UploadFile = File(...),
+    replace: bool = Form(False),
+    user: dict = Depends(get_current_user)  # ✅ Require auth
+):
+    """
+    🗂️ Register a whole intake from one ZIP of photos named by reg_number
+    (CS2021_001.jpg, or a CS2021_001/ folder with several photos).
+    Streams newline-delimited JSON progress events and ends with a
+    summary listing every file that could not be registered.
+    Accessible only by lecturers/admins.
+    """
+    verify_admin(user)
+
+    # Keep the archive on disk; the upload is closed once this handler returns
+    archive_path = await run_in_threadpool(_save_upload, file.file)
+    if not await run_in_threadpool(zipfile.is_zipfile, archive_path):
+        _remove_file(archive_path)
+        raise HTTPException(status_code=400, detail="Upload a ZIP archive of face photos")
+
+    async def events():
+        db = SessionLocal()
+        try:
+            async for event in bulk_register(
+                db,
+                archive_path,
+                lambda images: _run_when_free(store_reference_images, images),
+                concurrency=max(inference_pool.size, 1),
+                replace=replace,
+            ):
+                yield json.dumps(event) + "\n"
+        finally:
+            db.close()
+            _remove_file(archive_path)
+
+    # Also removed after the response, in case the client left before the
+    # stream started and the generator never ran
+    return StreamingResponse(
+        events(), media_type="application/x-ndjson", background=BackgroundTask(_remove_file, archive_path)
+    )
+
+
+# ----------------------------
+# RE-EMBED STORED FACES (after a model change)
+# ----------------------------
+_reindex_task = None
+
+
+async def _run_reindex(lock_file):
+    db = SessionLocal()
+    try:
+        await reindex(db, lambda crop_hashes: _run_when_free(embed_stored_crops, crop_hashes))
+    except Exception:
+        pass  # recorded in the reindex status
+    finally:
+        db.close()
+        lock_file.close()
+
+
+@router.post("/reindex", tags=["Facial Recognition"])
+async def start_reindex(user: dict = Depends(get_current_user)):
+    """
+    🔄 Re-embed every stored face crop with the configured model in the
+    background. Only one reindex runs at a time across all workers. Safe to
+    start again after an interruption: crops already embedded with this
+    model are skipped.
+    Accessible only by lecturers/admins.
+    """
+    global _reindex_task
+    verify_admin(user)
+
+    lock_file = try_lock()
+    if lock_file is None:
+        return {"message": "Reindex already running", "status": read_status()}
+    _reindex_task = asyncio.create_task(_run_reindex(lock_file))
+    await asyncio.sleep(0)  # let it record its starting status
+    return {"message": "✅ Reindex started", "status": read_status()}
+
+
+@router.get("/reindex", tags=["Facial Recognition"])
+def reindex_progress(user: dict = Depends(get_current_user)):
+    """📈 Progress of the current or last reindex, from any worker."""
+    verify_admin(user)
+    return read_status()
@@ -0,0 +1,110 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.models import AttendanceCourseDaily, AttendanceFacultyWeekly, AttendanceStudentCourse, Courses, Students
+from app.auth_utils import get_current_user
+from datetime import date
+
+router = APIRouter()
+
+# Chart endpoints: read the attendance rollups (see app/rollups.py), a
+# primary-key range per request, instead of counting raw attendance rows.
+# Rows whose records were all deleted stay behind with zero counts and are skipped.
+
+def _counts(row) -> dict:
+    return {
+        "total": row.total,
+        "present": row.present,
+        "late": row.late,
+        "absent": row.absent,
+        "attendance_rate": round(((row.present + row.late) / row.total * 100) if row.total else 0, 2),
+    }
+
+
+def _lecturer_only(user: dict):
+    if user["role"] != "lecturer":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied: Lecturer only")
+
+
+# ----------------------------
+# Course attendance per day
+# ----------------------------
+@router.get("/course-daily/{course_id}", tags=["Reports"])
+def course_daily(
+    course_id: int,
+    start_date: date = None,
+    end_date: date = None,
+    db: Session = Depends(get_db),
+    user: dict = Depends(get_current_user),
+):
+    _lecturer_only(user)
+    query = db.query(AttendanceCourseDaily).filter(
+        AttendanceCourseDaily.course_id == course_id, AttendanceCourseDaily.total > 0
+    )
+    if start_date is not None:
+        query = query.filter(AttendanceCourseDaily.date >= start_date)
+    if end_date is not None:
+        query = query.filter(AttendanceCourseDaily.date <= end_date)
+    return {
+        "course_id": course_id,
+        "days": [{"date": row.date, **_counts(row)} for row in query.order_by(AttendanceCourseDaily.date)],
+    }
+
+
+# ----------------------------
+# Student attendance per course
+# ----------------------------
+@router.get("/student-courses/{student_id}", tags=["Reports"])
+def student_courses(
+    student_id: int,
+    db: Session = Depends(get_db),
+    user: dict = Depends(get_current_user),
+):
+    # Students may only read their own totals
+    if user["role"] == "student":
+        own = db.query(Students.student_id).filter(Students.email == user["sub"]).scalar()
+        if own != student_id:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
+
+    rows = (
+        db.query(AttendanceStudentCourse, Courses.course_name, Courses.course_code)
+        .join(Courses, Courses.course_id == AttendanceStudentCourse.course_id)
+        .filter(AttendanceStudentCourse.student_id == student_id, AttendanceStudentCourse.total > 0)
+        .order_by(Courses.course_code)
+        .all()
+    )
+    return {
+        "student_id": student_id,
+        "courses": [
+            {"course_id": row.course_id, "course_name": name, "course_code": code, **_counts(row)}
+            for row, name, code in rows
+        ],
+    }
+
+
+# ----------------------------
+# Faculty attendance per week
+# ----------------------------
+@router.get("/faculty-weekly/{faculty_id}", tags=["Reports"])
+def faculty_weekly(
+    faculty_id: int,
+    start_date: date = None,
+    end_date: date = None,
+    db: Session = Depends(get_db),
+    user: dict = Depends(get_current_user),
+):
+    _lecturer_only(user)
+    query = db.query(AttendanceFacultyWeekly).filter(
+        AttendanceFacultyWeekly.faculty_id == faculty_id, AttendanceFacultyWeekly.total > 0
+    )
+    if start_date is not None:
+        query = query.filter(AttendanceFacultyWeekly.week_start >= start_date)
+    if end_date is not None:
+        query = query.filter(AttendanceFacultyWeekly.week_start <= end_date)
+    return {
+        "faculty_id": faculty_id,
+        "weeks": [
+            {"week_start": row.week_start, **_counts(row)}
+            for row in query.order_by(AttendanceFacultyWeekly.week_start)
+        ],
+    }
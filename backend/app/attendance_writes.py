@@ -0,0 +1,98 @@
+from sqlalchemy import and_, literal_column, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.models import Attendance
+from app.rollups import record_changes
+
+# ------------------------------------------------------------
+# ATTENDANCE UPSERT
+# ------------------------------------------------------------
+# A student has at most one attendance row per course and day
+# (uq_attendance_daily). Every write path goes through upsert_attendance():
+# one INSERT ... ON CONFLICT DO UPDATE, so two concurrent marks of the same
+# student cannot create a duplicate. The constraint is NULLS NOT DISTINCT,
+# so marks without a course conflict too. Rows are written in key order:
+# two batches that share students then lock their rows in the same order
+# and wait for each other instead of deadlocking.
+#
+# Rollups need the status each update replaces. The existing rows are first
+# locked with SELECT ... FOR UPDATE, which reads their latest committed
+# status, and the upsert only updates those locked rows. A row another
+# transaction inserted in between is left alone by the upsert and written
+# again on the next pass, once it has been locked and its status is known.
+
+# xmax = 0 marks a row this statement inserted
+INSERTED = literal_column("xmax = 0").label("inserted")
+
+
+def _key(row) -> tuple:
+    return (row["student_id"], row["course_id"], row["date"])
+
+
+def _lock_existing(db: Session, keys: list) -> dict:
+    """Lock the attendance rows of `keys` in key order; returns {key: (attendance_id, status)}."""
+    with_course = [key for key in keys if key[1] is not None]
+    without_course = [key for key in keys if key[1] is None]
+    conditions = []
+    if with_course:
+        conditions.append(tuple_(Attendance.student_id, Attendance.course_id, Attendance.date).in_(with_course))
+    if without_course:
+        # A NULL course never equals anything inside IN, so match it separately
+        conditions.append(and_(
+            Attendance.course_id.is_(None),
+            tuple_(Attendance.student_id, Attendance.date).in_([(key[0], key[2]) for key in without_course]),
+        ))
+    locked = db.execute(
+        select(Attendance.attendance_id, Attendance.student_id, Attendance.course_id, Attendance.date, Attendance.status)
+        .where(or_(*conditions))
+        .order_by(Attendance.student_id, Attendance.course_id, Attendance.date)
+        .with_for_update()
+    ).all()
+    return {(row.student_id, row.course_id, row.date): (row.attendance_id, row.status) for row in locked}
+
+
+def upsert_attendance(db: Session, rows: list[dict], update: tuple = ("status",)):
+    """
+    Insert attendance rows, or update `update` columns of the row that
+    already exists for the same student, course and date. Rollups are
+    adjusted in the same transaction; the caller commits.
+    Returns (attendance_id, student_id, inserted) per written row.
+    """
+    # One statement may not touch the same row twice; the last row for a key wins
+    by_key = {_key(r): r for r in rows}
+    # NULL sorts last, as in Postgres
+    keys = sorted(by_key, key=lambda key: [(v is None, v) for v in key])
+
+    removed, added, result = [], [], []
+    while keys:
+        existing = _lock_existing(db, keys)
+        stmt = insert(Attendance).values([by_key[key] for key in keys])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["student_id", "course_id", "date"],  # uq_attendance_daily
+            set_={column: stmt.excluded[column] for column in update},
+            # Rows inserted by others since the lock are skipped, and retried below
+            where=Attendance.attendance_id.in_([attendance_id for attendance_id, _ in existing.values()]),
+        )
+        written = db.execute(stmt.returning(
+            Attendance.attendance_id,
+            Attendance.student_id,
+            Attendance.course_id,
+            Attendance.date,
+            Attendance.status,
+            INSERTED,
+        )).all()
+
+        for row in written:
+            key = (row.student_id, row.course_id, row.date)
+            if row.inserted:
+                added.append((*key, row.status))
+            elif existing[key][1] != row.status:
+                removed.append((*key, existing[key][1]))
+                added.append((*key, row.status))
+            result.append((row.attendance_id, row.student_id, row.inserted))
+
+        done = {(row.student_id, row.course_id, row.date) for row in written}
+        keys = [key for key in keys if key not in done]
+
+    record_changes(db, removed, added)
+    return result
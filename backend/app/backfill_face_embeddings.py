@@ -0,0 +1,42 @@
+from app.database import SessionLocal
+from app.models import Students
+from app.ai.face_embeddings import add_face_images
+from app.ai.face_store import crop_path
+from app.ai.gallery import rebuild_index
+from app.ai.inference_pool import store_reference_images
+import os
+
+# One-off migration: move faces registered before the face store existed
+# (a full photo at students.image_path) into the store and embed them.
+# After a model change, run app.reindex_faces instead.
+db = SessionLocal()
+
+try:
+    students = (
+        db.query(Students)
+        .filter(Students.image_path.isnot(None), ~Students.face_images.any())
+        .all()
+    )
+    embedded, skipped = 0, 0
+
+    for student in students:
+        if not os.path.exists(student.image_path):
+            skipped += 1
+            continue
+        result = store_reference_images([student.image_path])[0]
+        if isinstance(result, ValueError):
+            print(f"⚠️ No face detected for {student.student_name} ({student.image_path})")
+            skipped += 1
+            continue
+
+        add_face_images(db, student.student_id, [result])
+        student.image_path = crop_path(result[0])
+        embedded += 1
+
+    db.commit()
+    rebuild_index(db)
+    print(f"✅ Stored {embedded} face embeddings ({skipped} skipped).")
+except Exception as e:
+    print("❌ Error while backfilling face embeddings:", e)
+finally:
+    db.close()
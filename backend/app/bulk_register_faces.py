@@ -0,0 +1,54 @@
+from concurrent.futures import ProcessPoolExecutor
+from app.database import SessionLocal
+from app.ai.bulk_registration import bulk_register
+from app.ai.inference_pool import _init_worker, store_reference_images
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+
+# Register a whole intake from a ZIP or directory of photos named by
+# reg_number, embedding on every core:
+#   python -m app.bulk_register_faces photos.zip --report errors.json
+
+
+async def main(args):
+    workers = args.workers or os.cpu_count()
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+    loop = asyncio.get_running_loop()
+
+    def embed(images):
+        return loop.run_in_executor(executor, store_reference_images, images)
+
+    db = SessionLocal()
+    try:
+        # Two chunks per worker keep every core busy while results are saved
+        async for event in bulk_register(db, args.source, embed, concurrency=workers * 2, replace=args.replace):
+            if event["type"] == "start":
+                print(f"📂 {event['total']} files, {event['to_embed']} to embed on {workers} workers")
+            elif event["type"] == "progress":
+                print(f"⏳ {event['done']}/{event['total']} done, {event['failed']} failed", end="\r", flush=True)
+            else:
+                print(f"\n✅ Registered {event['registered_students']} students ({event['failed']} files failed).")
+                with open(args.report, "w") as f:
+                    json.dump(event["errors"], f, indent=2)
+                print(f"📝 Error report written to {args.report}")
+    except Exception as e:
+        print("\n❌ Error during bulk registration:", e)
+    finally:
+        db.close()
+        executor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-register student faces")
+    parser.add_argument("source", help="ZIP archive or directory of photos named by reg_number")
+    parser.add_argument("--workers", type=int, default=0, help="embedding processes (default: all cores)")
+    parser.add_argument("--replace", action="store_true", help="discard photos already on file")
+    parser.add_argument("--report", default="bulk_register_errors.json", help="where to write the per-file error report")
+    asyncio.run(main(parser.parse_args()))
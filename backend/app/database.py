@@ -1,8 +1,12 @@
 # backend/app/database.py
 import os
+import time
+from collections import deque
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 # Load environment variables
 load_dotenv()
@@ -13,15 +17,119 @@ DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 
-# Construct connection URL
+# Construct connection URLs: asyncpg for the API, psycopg2 for scripts and worker threads
 DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-# SQLAlchemy setup
-engine = create_engine(DATABASE_URL)
+# ------------------------------------------------------------
+# CONNECTION POOL CONFIGURATION (per engine, per worker process)
+# ------------------------------------------------------------
+# Connections kept open, and extra ones allowed during spikes (closed when returned)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+# Seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Connections older than this many seconds are replaced (before server/proxy idle cut-offs)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Test each connection with a cheap round-trip when it is checked out ("0" to disable)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+# Longest any single statement may run, in milliseconds (0 = no limit)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+
+# ------------------------------------------------------------
+# POOL METRICS
+# ------------------------------------------------------------
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    # A class attribute, so it survives the pool being recreated after a disconnect
+    metrics = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        self.metrics.record_wait(time.perf_counter() - started, self.checkedout())
+        return connection
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """The same, for the asyncio engine."""
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.peak_checked_out = 0
+        self.waits_ms = deque(maxlen=1000)
+
+    def record_wait(self, seconds: float, checked_out: int):
+        self.checkouts += 1
+        self.waits_ms.append(seconds * 1000)
+        self.peak_checked_out = max(self.peak_checked_out, checked_out)
+
+    def snapshot(self, pool: QueuePool) -> dict:
+        waits = sorted(self.waits_ms) or [0.0]
+        return {
+            "pool_size": pool.size(),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "peak_checked_out": self.peak_checked_out,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_ms": {
+                "p50": round(waits[len(waits) // 2], 2),
+                "p95": round(waits[int(len(waits) * 0.95)], 2),
+                "max": round(waits[-1], 2),
+            },
+        }
+
+
+InstrumentedQueuePool.metrics = PoolMetrics()
+InstrumentedAsyncQueuePool.metrics = PoolMetrics()
+
+POOL_ARGS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+# SQLAlchemy setup (sync): scripts, background tasks and the face recognition routes
+engine = create_engine(
+    DATABASE_URL,
+    poolclass=InstrumentedQueuePool,
+    connect_args=(
+        {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"} if DB_STATEMENT_TIMEOUT_MS else {}
+    ),
+    **POOL_ARGS,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-# Dependency for routes
+# SQLAlchemy setup (asyncio): routes that only wait on the database, so a
+# request waiting on Postgres no longer holds one of the threadpool's slots
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=InstrumentedAsyncQueuePool,
+    connect_args=(
+        {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}} if DB_STATEMENT_TIMEOUT_MS else {}
+    ),
+    **POOL_ARGS,
+)
+# Objects stay readable after commit: lazy loads are not possible in async code
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+# Dependency for routes: one session per request, always closed
 def get_db():
     db = SessionLocal()
     try:
@@ -29,6 +137,20 @@ def get_db():
     finally:
         db.close()
 
+
+# Dependency for async routes
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def pool_status() -> dict:
+    """Connection pool usage of this worker, for diagnosing connection starvation."""
+    return {
+        "sync": engine.pool.metrics.snapshot(engine.pool),
+        "async": async_engine.pool.metrics.snapshot(async_engine.pool),
+    }
+
 # Quick test when running directly
 if __name__ == "__main__":
     try:
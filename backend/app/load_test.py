@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import threading
+import time
+import requests
+
+# Hit one endpoint of a running API with many concurrent clients and report
+# throughput and latency, e.g. to compare worker or pool settings:
+#   python -m app.load_test --email student@example.com --password secret \
+#       --path /attendance/my-attendance --concurrency 100 --requests 5000
+
+_local = threading.local()
+
+
+def _session(token: str) -> requests.Session:
+    # One keep-alive connection per client thread
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+        _local.session.headers["Authorization"] = f"Bearer {token}"
+    return _local.session
+
+
+def _call(args, token: str):
+    started = time.perf_counter()
+    try:
+        response = _session(token).request(args.method, args.url + args.path, timeout=args.timeout)
+        ok = response.status_code < 400
+    except requests.RequestException:
+        ok = False
+    return ok, (time.perf_counter() - started) * 1000
+
+
+def _percentile(values: list, pct: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
+def main(args):
+    login = requests.post(
+        f"{args.url}/auth/login", json={"email": args.email, "password": args.password}, timeout=args.timeout
+    )
+    login.raise_for_status()
+    token = login.json()["access_token"]
+
+    print(f"⏳ {args.requests} × {args.method} {args.path} with {args.concurrency} concurrent clients")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda _: _call(args, token), range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(ms for ok, ms in results if ok)
+    errors = len(results) - len(latencies)
+    print(f"✅ {len(results) / elapsed:.1f} requests/s over {elapsed:.1f}s, {errors} errors")
+    print(
+        f"   latency ms: p50 {_percentile(latencies, 50):.1f}"
+        f"  p95 {_percentile(latencies, 95):.1f}"
+        f"  p99 {_percentile(latencies, 99):.1f}"
+        f"  max {_percentile(latencies, 100):.1f}"
+    )
+
+    # Pool usage of whichever worker answers, to spot connection starvation
+    metrics = _session(token).get(f"{args.url}/metrics/database", timeout=args.timeout)
+    if metrics.ok:
+        print("   database pool:", metrics.json())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent load test against a running API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="API base URL")
+    parser.add_argument("--email", required=True, help="account used to log in")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--path", default="/attendance/my-attendance", help="endpoint to call")
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--concurrency", type=int, default=50, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=2000, help="total requests")
+    parser.add_argument("--timeout", type=float, default=30, help="per-request timeout in seconds")
+    main(parser.parse_args())
@@ -1,5 +1,6 @@
 
-from fastapi import FastAPI, Request
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer  # ✅ Added for Bearer token support
@@ -10,7 +11,26 @@ from app.api import (
     face_recognition,
     face_registration,
     enrollment,  # ✅ Added Enrollment
+    reports,
 )
+from app.ai.audit_log import audit_log
+from app.ai.inference_pool import inference_pool
+from app.auth_utils import get_current_user
+from app.database import async_engine, pool_status
+
+# ------------------------------------------------------------
+# STARTUP: build recognition models once per worker
+# ------------------------------------------------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Inference processes load + warm up their models before traffic is accepted
+    await inference_pool.start()
+    audit_log.start()
+    yield
+    inference_pool.shutdown()
+    # Write out recognition audit entries still buffered in memory
+    audit_log.stop()
+    await async_engine.dispose()
 
 # ------------------------------------------------------------
 # APP METADATA
@@ -32,6 +52,7 @@ enrollment control, and admin-level analytics.
         "name": "MIT License",
         "url": "https://opensource.org/licenses/MIT",
     },
+    lifespan=lifespan,
 )
 
 # ------------------------------------------------------------
@@ -61,6 +82,7 @@ app.include_router(admin.router, prefix="/admin", tags=["Admin"])
 app.include_router(face_recognition.router, prefix="/face", tags=["Facial Recognition"])
 app.include_router(face_registration.router, prefix="/register", tags=["Face Registration"])
 app.include_router(enrollment.router, prefix="/enrollment", tags=["Enrollment"])  # ✅ Added Enrollment routes
+app.include_router(reports.router, prefix="/reports", tags=["Reports"])
 
 # ------------------------------------------------------------
 # GLOBAL EXCEPTION HANDLER (clean and standardized responses)
@@ -90,3 +112,28 @@ def read_root():
         "version": "1.4.0",
         "docs_url": "/docs"
     }
+
+
+# ------------------------------------------------------------
+# READINESS CHECK (for load balancers / orchestrators)
+# ------------------------------------------------------------
+@app.get("/ready", tags=["Root"])
+def readiness():
+    """
+    Reports ready only once the recognition model is loaded and warmed up.
+    """
+    if not inference_pool.ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ready"}
+
+
+# ------------------------------------------------------------
+# DATABASE POOL METRICS (per worker process)
+# ------------------------------------------------------------
+@app.get("/metrics/database", tags=["Root"])
+def database_metrics(user: dict = Depends(get_current_user)):
+    """
+    Connection pool usage: checked-out/idle connections, checkout wait times
+    and timeouts. Sustained waits mean DB_POOL_SIZE is too small for the load.
+    """
+    return pool_status()
@@ -9,6 +9,8 @@ from sqlalchemy import (
     Text,
     DECIMAL,
     TIMESTAMP,
+    LargeBinary,
+    UniqueConstraint,
 )
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime
@@ -67,6 +69,8 @@ class Students(Base):
     faculty = relationship("Faculties", back_populates="students")
     student_courses = relationship("StudentCourse", back_populates="student")
     attendance = relationship("Attendance", back_populates="student")
+    face_embeddings = relationship("FaceEmbeddings", back_populates="student")
+    face_images = relationship("FaceImages", back_populates="student")
 
 
 # ==========================================
@@ -108,6 +112,11 @@ class StudentCourse(Base):
 # ==========================================
 class Attendance(Base):
     __tablename__ = "attendance"
+    __table_args__ = (
+        UniqueConstraint(
+            "student_id", "course_id", "date", name="uq_attendance_daily", postgresql_nulls_not_distinct=True
+        ),
+    )
 
     attendance_id = Column(Integer, primary_key=True, index=True)
     student_id = Column(Integer, ForeignKey("students.student_id"))
@@ -136,3 +145,80 @@ class AttendanceLogs(Base):
     timestamp = Column(TIMESTAMP, default=datetime.utcnow)
     confidence_score = Column(DECIMAL(5, 2))
     system_note = Column(Text)
+
+
+# ==========================================
+# Face Embeddings Table
+# ==========================================
+class FaceEmbeddings(Base):
+    __tablename__ = "face_embeddings"
+    __table_args__ = (
+        UniqueConstraint("student_id", "model_name", "model_version", name="uq_face_embedding_model"),
+    )
+
+    embedding_id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey("students.student_id", ondelete="CASCADE"), nullable=False)
+    model_name = Column(String(50), nullable=False)
+    model_version = Column(String(20), nullable=False)
+    dimensions = Column(Integer, nullable=False)
+    embedding = Column(LargeBinary, nullable=False)  # float32 vector, raw bytes
+    image_count = Column(Integer, default=1)  # reference photos combined into this template
+    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+
+    student = relationship("Students", back_populates="face_embeddings")
+
+
+# ==========================================
+# Face Images Table (reference crops per student, embedded per model)
+# ==========================================
+class FaceImages(Base):
+    __tablename__ = "face_images"
+    __table_args__ = (
+        UniqueConstraint("student_id", "content_hash", "model_name", "model_version", name="uq_face_image_model"),
+    )
+
+    image_id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey("students.student_id", ondelete="CASCADE"), nullable=False)
+    content_hash = Column(String(64), nullable=False)  # normalized crop in the face store
+    model_name = Column(String(50), nullable=False)
+    model_version = Column(String(20), nullable=False)
+    embedding = Column(LargeBinary, nullable=False)  # float32 vector, raw bytes
+    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+
+    student = relationship("Students", back_populates="face_images")
+
+
+# ==========================================
+# Attendance Rollups (kept in step with every attendance write)
+# ==========================================
+class AttendanceCourseDaily(Base):
+    __tablename__ = "attendance_course_daily"
+
+    course_id = Column(Integer, ForeignKey("courses.course_id", ondelete="CASCADE"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    present = Column(Integer, nullable=False, default=0)
+    late = Column(Integer, nullable=False, default=0)
+    absent = Column(Integer, nullable=False, default=0)
+
+
+class AttendanceStudentCourse(Base):
+    __tablename__ = "attendance_student_course"
+
+    student_id = Column(Integer, ForeignKey("students.student_id", ondelete="CASCADE"), primary_key=True)
+    course_id = Column(Integer, ForeignKey("courses.course_id", ondelete="CASCADE"), primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    present = Column(Integer, nullable=False, default=0)
+    late = Column(Integer, nullable=False, default=0)
+    absent = Column(Integer, nullable=False, default=0)
+
+
+class AttendanceFacultyWeekly(Base):
+    __tablename__ = "attendance_faculty_weekly"
+
+    faculty_id = Column(Integer, ForeignKey("faculties.faculty_id", ondelete="CASCADE"), primary_key=True)
+    week_start = Column(Date, primary_key=True)  # Monday
+    total = Column(Integer, nullable=False, default=0)
+    present = Column(Integer, nullable=False, default=0)
+    late = Column(Integer, nullable=False, default=0)
+    absent = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,82 @@
+import json
+import os
+from fastapi import Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal
+
+# ------------------------------------------------------------
+# KEYSET PAGINATION AND NDJSON EXPORTS
+# ------------------------------------------------------------
+# List endpoints return one page of rows ordered by primary key, plus the key
+# to pass as `after` for the next page. Each page is an index range scan
+# (WHERE key > after ORDER BY key LIMIT n), so page 10,000 costs the same as
+# page 1, unlike OFFSET. `format=ndjson` streams every row instead, one JSON
+# object per line, fetched in batches so memory stays flat for any table size.
+
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "100"))
+PAGE_SIZE_MAX = 1000
+# Rows per query while streaming an export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+
+class PageParams:
+    """Query parameters shared by paginated list endpoints."""
+
+    def __init__(
+        self,
+        after: int = Query(None, description="next_cursor of the previous page"),
+        limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_SIZE_MAX),
+        format: str = Query("json", pattern="^(json|ndjson)$", description="ndjson streams all rows"),
+    ):
+        self.after = after
+        self.limit = limit
+        self.format = format
+
+
+def _after(stmt: Select, key, after: int | None) -> Select:
+    if after is not None:
+        stmt = stmt.where(key > after)
+    return stmt.order_by(key)
+
+
+async def keyset_page(db: AsyncSession, stmt: Select, key, after: int | None, limit: int):
+    """
+    One page of `stmt` (a column-projected select) after the `after` key.
+    Returns (rows as dicts, next_cursor); next_cursor is None on the last page.
+    """
+    # One extra row tells whether another page exists without a COUNT
+    rows = (await db.execute(_after(stmt, key, after).limit(limit + 1))).mappings().all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, rows[-1][key.key]
+
+
+async def _ndjson_batches(stmt: Select, key):
+    after = None
+    while True:
+        # A session per batch: no connection or transaction is held between
+        # batches, however slowly the client reads
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(_after(stmt, key, after).limit(EXPORT_BATCH_SIZE))).mappings().all()
+        if rows:
+            yield "".join(json.dumps(jsonable_encoder(dict(row))) + "\n" for row in rows)
+        if len(rows) < EXPORT_BATCH_SIZE:
+            return
+        after = rows[-1][key.key]
+
+
+def ndjson_export(stmt: Select, key) -> StreamingResponse:
+    """Stream every row of `stmt` as newline-delimited JSON, in key order."""
+    return StreamingResponse(_ndjson_batches(stmt, key), media_type="application/x-ndjson")
+
+
+async def paginate(db: AsyncSession, stmt: Select, key, page: PageParams, name: str, **extra):
+    """Serve `stmt` as one keyset page under `name`, or as an NDJSON export."""
+    if page.format == "ndjson":
+        return ndjson_export(stmt, key)
+    rows, next_cursor = await keyset_page(db, stmt, key, page.after, page.limit)
+    return {**extra, name: rows, "next_cursor": next_cursor}
@@ -0,0 +1,17 @@
+from app.database import SessionLocal
+from app.rollups import rebuild_rollups
+
+# Recompute the attendance rollup tables from scratch, e.g. after loading
+# seed data or editing attendance directly in SQL:
+#   python -m app.rebuild_rollups
+db = SessionLocal()
+
+try:
+    written = rebuild_rollups(db)
+    for table, rows in written.items():
+        print(f"✅ {table}: {rows} rows")
+except Exception as e:
+    db.rollback()
+    print("❌ Error while rebuilding attendance rollups:", e)
+finally:
+    db.close()
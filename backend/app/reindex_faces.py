@@ -0,0 +1,56 @@
+from concurrent.futures import ProcessPoolExecutor
+from app.database import SessionLocal
+from app.ai.inference_pool import _init_worker, embed_stored_crops
+from app.ai.reindex import read_status, reindex, try_lock
+import argparse
+import asyncio
+import multiprocessing
+import os
+
+# Re-embed every stored face crop after FACE_MODEL / FACE_MODEL_VERSION
+# changes. Interrupt at any time; running it again picks up where it stopped:
+#   FACE_MODEL=Facenet FACE_MODEL_VERSION=2 python -m app.reindex_faces
+
+
+async def main(args):
+    # Shares the lock with POST /register/reindex, so only one of them runs
+    lock_file = try_lock()
+    if lock_file is None:
+        print("❌ A reindex is already running:", read_status())
+        return
+
+    workers = args.workers or os.cpu_count()
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+    loop = asyncio.get_running_loop()
+
+    async def embed(crop_hashes):
+        # Split each batch across the workers
+        size = -(-len(crop_hashes) // workers)
+        parts = await asyncio.gather(*(
+            loop.run_in_executor(executor, embed_stored_crops, crop_hashes[i:i + size])
+            for i in range(0, len(crop_hashes), size)
+        ))
+        status = read_status()
+        print(f"⏳ {status['done'] + len(crop_hashes)}/{status['total']} crops", end="\r", flush=True)
+        return [result for part in parts for result in part]
+
+    db = SessionLocal()
+    try:
+        status = await reindex(db, embed)
+        print(f"\n✅ Re-embedded {status['done']} crops with {status['model']} ({status['failed']} failed).")
+    except Exception as e:
+        print("\n❌ Error while reindexing faces:", e)
+    finally:
+        db.close()
+        executor.shutdown()
+        lock_file.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-embed stored face crops with the configured model")
+    parser.add_argument("--workers", type=int, default=0, help="embedding processes (default: all cores)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,132 @@
+from datetime import timedelta
+from sqlalchemy import case, delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.models import (
+    Attendance,
+    AttendanceCourseDaily,
+    AttendanceFacultyWeekly,
+    AttendanceStudentCourse,
+    Courses,
+)
+
+# ------------------------------------------------------------
+# ATTENDANCE ROLLUPS
+# ------------------------------------------------------------
+# Dashboards read pre-counted attendance per course/day, student/course and
+# faculty/week instead of scanning raw attendance rows. Every write path
+# reports what it changed through record_changes() in the same transaction
+# as the attendance write; rebuild_rollups() recomputes everything.
+COUNTED = {"Present": "present", "Late": "late", "Absent": "absent"}
+
+
+def week_start(day):
+    """Monday of the week `day` falls in (same as Postgres date_trunc('week'))."""
+    return day - timedelta(days=day.weekday())
+
+
+def _add(counts: dict, key, status: str, sign: int):
+    row = counts.setdefault(key, {"total": 0, "present": 0, "late": 0, "absent": 0})
+    row["total"] += sign
+    if status in COUNTED:
+        row[COUNTED[status]] += sign
+
+
+def _upsert(db: Session, model, key_columns: tuple, counts: dict):
+    """Add count deltas to a rollup table, one multi-row INSERT ... ON CONFLICT."""
+    # Attendance without a course (or student) has no rollup row, as in
+    # rebuild_rollups(). Sorted by key so concurrent writers lock rows in the
+    # same order and cannot deadlock.
+    keys = sorted(key for key, delta in counts.items() if None not in key and any(delta.values()))
+    rows = [{**dict(zip(key_columns, key)), **counts[key]} for key in keys]
+    if not rows:
+        return
+    stmt = insert(model).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=list(key_columns),
+        set_={
+            column: getattr(model, column) + getattr(stmt.excluded, column)
+            for column in ("total", "present", "late", "absent")
+        },
+    ))
+
+
+def record_changes(db: Session, removed=(), added=()):
+    """
+    Apply attendance changes to every rollup. `removed` and `added` hold
+    (student_id, course_id, date, status) of rows as they were before and
+    after the write: an insert only adds, a delete only removes, and a
+    status change removes the old version and adds the new one. The caller
+    commits, together with the attendance write.
+    """
+    changes = [(row, -1) for row in removed] + [(row, 1) for row in added]
+    if not changes:
+        return
+    course_ids = {course_id for (_, course_id, _, _), _ in changes}
+    faculty_of = dict(
+        db.query(Courses.course_id, Courses.faculty_id).filter(Courses.course_id.in_(course_ids))
+    )
+
+    daily, per_student, weekly = {}, {}, {}
+    for (student_id, course_id, day, status), sign in changes:
+        _add(daily, (course_id, day), status, sign)
+        _add(per_student, (student_id, course_id), status, sign)
+        if faculty_of.get(course_id) is not None and day is not None:
+            _add(weekly, (faculty_of[course_id], week_start(day)), status, sign)
+
+    _upsert(db, AttendanceCourseDaily, ("course_id", "date"), daily)
+    _upsert(db, AttendanceStudentCourse, ("student_id", "course_id"), per_student)
+    _upsert(db, AttendanceFacultyWeekly, ("faculty_id", "week_start"), weekly)
+
+
+# ------------------------------------------------------------
+# FULL REBUILD
+# ------------------------------------------------------------
+def _counts():
+    return [
+        func.count().label("total"),
+        *(
+            func.count(case((Attendance.status == status, 1))).label(column)
+            for status, column in COUNTED.items()
+        ),
+    ]
+
+
+def rebuild_rollups(db: Session) -> dict:
+    """
+    Recompute every rollup from the attendance table in one transaction.
+    Attendance writes wait until it commits, so no change is lost or
+    counted twice. Returns the number of rows written per table.
+    """
+    # A full recount may outlast DB_STATEMENT_TIMEOUT_MS; lift it for this transaction only
+    db.execute(text("SET LOCAL statement_timeout = 0"))
+    db.execute(text("LOCK TABLE attendance IN SHARE MODE"))
+    for model in (AttendanceCourseDaily, AttendanceStudentCourse, AttendanceFacultyWeekly):
+        db.execute(delete(model))
+
+    columns = ["total", "present", "late", "absent"]
+    week = func.date_trunc("week", Attendance.date).cast(Attendance.date.type)
+    sources = {
+        AttendanceCourseDaily: select(Attendance.course_id, Attendance.date, *_counts())
+        .where(Attendance.course_id.isnot(None))
+        .group_by(Attendance.course_id, Attendance.date),
+        AttendanceStudentCourse: select(Attendance.student_id, Attendance.course_id, *_counts())
+        .where(Attendance.student_id.isnot(None), Attendance.course_id.isnot(None))
+        .group_by(Attendance.student_id, Attendance.course_id),
+        AttendanceFacultyWeekly: select(Courses.faculty_id, week, *_counts())
+        .join(Courses, Courses.course_id == Attendance.course_id)
+        .where(Courses.faculty_id.isnot(None))
+        .group_by(Courses.faculty_id, week),
+    }
+    keys = {
+        AttendanceCourseDaily: ["course_id", "date"],
+        AttendanceStudentCourse: ["student_id", "course_id"],
+        AttendanceFacultyWeekly: ["faculty_id", "week_start"],
+    }
+
+    written = {}
+    for model, source in sources.items():
+        result = db.execute(insert(model).from_select(keys[model] + columns, source))
+        written[model.__tablename__] = result.rowcount
+    db.commit()
+    return written
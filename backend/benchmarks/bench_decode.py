@@ -0,0 +1,100 @@
+"""
+Decode benchmark: full-resolution decode + resize (the old path) against
+the shared reduced-resolution decode stage, for typical upload sizes.
+
+Run from backend/:
+    python -m benchmarks.bench_decode [--repeat 20]
+
+Reports median decode time and the peak memory allocated for the frame.
+"""
+from app.ai.image_pipeline import FACE_PROBE_MAX_SIDE, decode_image
+from app.ai.inference_pool import CLASSROOM_MAX_SIDE
+import argparse
+import cv2
+import numpy as np
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+SIZES = {
+    "webcam 640x480": (640, 480),
+    "phone 1080p": (1920, 1080),
+    "phone 12MP": (4032, 3024),
+    "DSLR 24MP": (6000, 4000),
+}
+
+
+def synthetic_jpeg(width: int, height: int) -> bytes:
+    """A photo-like JPEG: smooth gradients plus noise, so it compresses realistically."""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 / width, y * 255 / height, (x + y) * 127 / (width + height)], axis=-1)
+    noisy = base + rng.normal(0, 12, base.shape)
+    return cv2.imencode(".jpg", np.clip(noisy, 0, 255).astype(np.uint8), [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def old_decode(image_data: bytes, max_side: int) -> np.ndarray:
+    frame = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    scale = max_side / max(frame.shape[:2])
+    if scale < 1:
+        frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return frame
+
+
+def old_service_roundtrip(image_data: bytes, max_side: int) -> np.ndarray:
+    """The webcam service used to write each frame to disk and read it back."""
+    frame = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    path = os.path.join(tempfile.gettempdir(), "bench_capture.jpg")
+    cv2.imwrite(path, frame)
+    frame = cv2.imread(path)
+    os.remove(path)
+    return frame
+
+
+def new_decode(image_data: bytes, max_side: int) -> np.ndarray:
+    return decode_image(image_data, max_side)[0]
+
+
+def measure(fn, image_data: bytes, max_side: int, repeat: int) -> tuple[float, float]:
+    """Median milliseconds and peak traced MB for one call."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(image_data, max_side)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    fn(image_data, max_side)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    cases = [("probe", FACE_PROBE_MAX_SIDE), ("classroom", CLASSROOM_MAX_SIDE)]
+    methods = [("full decode + resize", old_decode), ("reduced decode", new_decode)]
+
+    print(f"{'image':<16} {'target':<16} {'method':<22} {'median ms':>10} {'peak MB':>9}")
+    for label, (width, height) in SIZES.items():
+        image_data = synthetic_jpeg(width, height)
+        for case, max_side in cases:
+            for method, fn in methods:
+                ms, mb = measure(fn, image_data, max_side, args.repeat)
+                print(f"{label:<16} {f'{case} ({max_side})':<16} {method:<22} {ms:>10.2f} {mb:>9.1f}")
+
+    image_data = synthetic_jpeg(640, 480)
+    ms, mb = measure(old_service_roundtrip, image_data, FACE_PROBE_MAX_SIDE, args.repeat)
+    print(f"{'webcam 640x480':<16} {'service':<16} {'temp file round-trip':<22} {ms:>10.2f} {mb:>9.1f}")
+    ms, mb = measure(lambda data, _: cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR),
+                     image_data, FACE_PROBE_MAX_SIDE, args.repeat)
+    print(f"{'webcam 640x480':<16} {'service':<16} {'in memory':<22} {ms:>10.2f} {mb:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
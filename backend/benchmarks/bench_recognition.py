@@ -0,0 +1,260 @@
+"""
+Recognition benchmark.
+
+Synthetic mode (default, runs offline): builds galleries of 1k / 10k / 50k
+students with a stub embedder and compares, per probe,
+
+  verify loop  the original /recognize-face: DeepFace.verify against each
+               student in turn (two embeddings per student) until one is
+               under the threshold
+  exact        one probe embedding + FaceMatcher (one matrix product)
+  ivf          one probe embedding + IVFIndex (FACE_INDEX_NPROBE lists)
+
+reporting p50/p95/p99 latency, throughput, memory and recall@1.
+
+Real mode (--real DIR) runs DeepFace backends over a local image set laid
+out as DIR/<person>/<photo>.jpg and compares accuracy against speed, with
+each photo matched against templates built from all the other photos.
+
+Run from backend/:
+    python -m benchmarks.bench_recognition
+    python -m benchmarks.bench_recognition --sizes 1000 10000 --embed-ms 30
+    python -m benchmarks.bench_recognition --real ~/faces --models VGG-Face Facenet ArcFace
+"""
+from app.ai.ann_index import IVFIndex
+from app.ai.matcher import FaceMatcher, normalize
+import argparse
+import numpy as np
+import os
+import time
+import tracemalloc
+
+FACE_INDEX_NPROBE = int(os.getenv("FACE_INDEX_NPROBE", "8"))
+FACE_MATCH_THRESHOLD = float(os.getenv("FACE_MATCH_THRESHOLD", "0.4"))
+
+
+# ------------------------------------------------------------
+# STUB EMBEDDER
+# ------------------------------------------------------------
+class StubEmbedder:
+    """
+    Offline stand-in for the recognition model. A synthetic photo is an
+    (identity, variant) pair; its embedding is the identity's direction
+    plus per-photo noise, so photos of one person land close together.
+    Each call burns `cost_ms` of CPU, like a forward pass would.
+    """
+
+    def __init__(self, identities: int, dim: int, cost_ms: float, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.centers = normalize(rng.standard_normal((identities, dim)))
+        # Some people photograph less consistently than others
+        self.spread = rng.uniform(0.3, 0.7, identities)
+        self.dim = dim
+        self.seed = seed
+        self._work = np.ones((64, 64), dtype=np.float32)
+        self._units_per_ms = self._calibrate() if cost_ms else 0
+        self.cost_units = int(cost_ms * self._units_per_ms)
+
+    def _calibrate(self) -> float:
+        started = time.perf_counter()
+        for _ in range(2000):
+            self._work @ self._work
+        return 2000 / ((time.perf_counter() - started) * 1000)
+
+    def embed(self, identity: int, variant: int, simulate_cost: bool = True) -> np.ndarray:
+        for _ in range(self.cost_units if simulate_cost else 0):
+            self._work @ self._work
+        rng = np.random.default_rng((self.seed, identity, variant))
+        noise = rng.standard_normal(self.dim) * self.spread[identity] / np.sqrt(self.dim)
+        return (self.centers[identity] + noise).astype(np.float32)
+
+
+# ------------------------------------------------------------
+# MEASUREMENT HELPERS
+# ------------------------------------------------------------
+def percentiles(latencies_ms) -> dict:
+    values = np.asarray(latencies_ms)
+    return {f"p{p}": float(np.percentile(values, p)) for p in (50, 95, 99)}
+
+
+def traced_peak_mb(fn):
+    """Run fn under tracemalloc; return its result and peak traced memory in MB."""
+    tracemalloc.start()
+    try:
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak / 2**20
+
+
+def print_row(size, method, stats, throughput, memory_mb, recall, note=""):
+    print(
+        f"{size:>7} {method:<12} {stats['p50']:>9.2f} {stats['p95']:>9.2f} {stats['p99']:>9.2f} "
+        f"{throughput:>10.3g} {memory_mb:>9.3g} {recall:>8.3f}  {note}"
+    )
+
+
+# ------------------------------------------------------------
+# SYNTHETIC MODE
+# ------------------------------------------------------------
+def bench_verify_loop(embedder, references, probes, threshold, sample):
+    """
+    Time `sample` real verify calls (two embeddings + a distance), then
+    derive each probe's latency from how far down the student list the
+    loop would have walked before stopping. Too slow to run in full.
+    Memory is the peak traced during the timed verify calls; the loop keeps
+    no gallery, only the embeddings of the current pair.
+    """
+    def timed_verifies():
+        started = time.perf_counter()
+        for student in range(sample):
+            a = normalize(embedder.embed(*probes[student % len(probes)]))
+            b = normalize(embedder.embed(student, 0))
+            float(1 - a @ b)
+        return (time.perf_counter() - started) * 1000 / sample
+
+    per_verify_ms, memory_mb = traced_peak_mb(timed_verifies)
+
+    latencies, correct = [], 0
+    for identity, variant in probes:
+        distances = 1 - references @ normalize(embedder.embed(identity, variant, simulate_cost=False))
+        hits = np.flatnonzero(distances < threshold)
+        walked = hits[0] + 1 if len(hits) else len(references)
+        latencies.append(walked * per_verify_ms)
+        correct += bool(len(hits)) and hits[0] == identity
+    return latencies, memory_mb, correct / len(probes)
+
+
+def bench_index(embedder, index, probes, k=5, **search_args):
+    latencies, search_ms, correct = [], [], 0
+    started_all = time.perf_counter()
+    for identity, variant in probes:
+        started = time.perf_counter()
+        probe = embedder.embed(identity, variant)
+        searched = time.perf_counter()
+        candidates = index.search(probe, k, **search_args)
+        finished = time.perf_counter()
+        latencies.append((finished - started) * 1000)
+        search_ms.append((finished - searched) * 1000)
+        correct += bool(candidates) and candidates[0][0] == identity
+    throughput = len(probes) / (time.perf_counter() - started_all)
+    return latencies, search_ms, throughput, correct / len(probes)
+
+
+def run_synthetic(args):
+    print(f"stub embedder: dim={args.dim}, {args.embed_ms} ms/embedding, {args.probes} probes per gallery")
+    print(f"{'gallery':>7} {'method':<12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'probes/s':>10} {'mem MB':>9} {'recall@1':>8}")
+
+    for size in args.sizes:
+        embedder = StubEmbedder(size, args.dim, args.embed_ms)
+        rng = np.random.default_rng(size)
+        probes = [(int(i), int(v)) for i, v in zip(rng.integers(0, size, args.probes), rng.integers(1, 1000, args.probes))]
+
+        # Gallery: one reference photo per student, embedded once (no simulated cost)
+        references = np.vstack([embedder.embed(i, 0, simulate_cost=False) for i in range(size)])
+
+        latencies, verify_mb, recall = bench_verify_loop(
+            embedder, normalize(references), probes, args.threshold, min(args.verify_sample, size)
+        )
+        print_row(size, "verify loop", percentiles(latencies), 1000 / np.mean(latencies), verify_mb, recall,
+                  "extrapolated from timed verify calls")
+
+        exact, exact_mb = traced_peak_mb(lambda: FaceMatcher(range(size), references))
+        latencies, search_ms, throughput, recall = bench_index(embedder, exact, probes)
+        print_row(size, "exact", percentiles(latencies), throughput, exact_mb, recall,
+                  f"search p50 {np.percentile(search_ms, 50):.3f} ms")
+
+        started = time.perf_counter()
+        ivf, ivf_mb = traced_peak_mb(lambda: IVFIndex.build(range(size), references, nprobe=args.nprobe))
+        build_s = time.perf_counter() - started
+        latencies, search_ms, throughput, recall = bench_index(embedder, ivf, probes)
+        print_row(size, f"ivf/{args.nprobe}", percentiles(latencies), throughput, ivf_mb, recall,
+                  f"search p50 {np.percentile(search_ms, 50):.3f} ms, {ivf.nlist} lists, built in {build_s:.1f}s")
+
+
+# ------------------------------------------------------------
+# REAL MODE
+# ------------------------------------------------------------
+def load_image_set(root: str) -> list[tuple[str, str]]:
+    photos = []
+    for person in sorted(os.listdir(root)):
+        folder = os.path.join(root, person)
+        if os.path.isdir(folder):
+            photos += [(person, os.path.join(folder, name)) for name in sorted(os.listdir(folder))]
+    return photos
+
+
+def run_real(args):
+    from deepface.modules.verification import find_threshold
+    from app.ai.face_embeddings import build_template
+    from app.ai.face_model import FaceModel
+
+    photos = load_image_set(args.real)
+    people = sorted({person for person, _ in photos})
+    print(f"{len(photos)} photos of {len(people)} people")
+    print(f"{'model':<10} {'dim':>5} {'embed p50':>10} {'embed p95':>10} {'top-1':>7} {'TAR':>7} {'FAR':>7} {'threshold':>10}")
+
+    for model_name in args.models:
+        try:
+            model = FaceModel(model_name)
+            model.warm_up()
+        except Exception as e:  # missing weights, incompatible TensorFlow build...
+            print(f"{model_name:<10} could not be loaded: {e}")
+            continue
+        threshold = find_threshold(model_name, "cosine")
+
+        embeddings, owners, timings = [], [], []
+        for person, path in photos:
+            started = time.perf_counter()
+            try:
+                embeddings.append(model.embed(path, enforce_detection=False))
+            except ValueError:
+                continue
+            timings.append((time.perf_counter() - started) * 1000)
+            owners.append(person)
+
+        # Each photo is the probe once; templates come from every other photo
+        top1 = accepted = false_accepts = 0
+        for i, probe in enumerate(embeddings):
+            ids, templates = [], []
+            for p, person in enumerate(people):
+                others = [e for j, e in enumerate(embeddings) if owners[j] == person and j != i]
+                if others:
+                    ids.append(p)
+                    templates.append(build_template(others))
+            best_id, distance = FaceMatcher(ids, templates).search(probe, k=1)[0]
+            correct = people[best_id] == owners[i]
+            top1 += correct
+            accepted += correct and distance < threshold
+            false_accepts += (not correct) and distance < threshold
+
+        n = len(embeddings)
+        stats = percentiles(timings)
+        print(
+            f"{model_name:<10} {len(embeddings[0]):>5} {stats['p50']:>10.1f} {stats['p95']:>10.1f} "
+            f"{top1 / n:>7.3f} {accepted / n:>7.3f} {false_accepts / n:>7.3f} {threshold:>10.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--dim", type=int, default=512, help="embedding size (VGG-Face is 4096, Facenet 128)")
+    parser.add_argument("--embed-ms", type=float, default=15, help="simulated CPU cost of one embedding")
+    parser.add_argument("--probes", type=int, default=200)
+    parser.add_argument("--verify-sample", type=int, default=200, help="verify calls actually timed per gallery")
+    parser.add_argument("--nprobe", type=int, default=FACE_INDEX_NPROBE)
+    parser.add_argument("--threshold", type=float, default=FACE_MATCH_THRESHOLD)
+    parser.add_argument("--real", metavar="DIR", help="run real DeepFace backends over DIR/<person>/<photo>")
+    parser.add_argument("--models", nargs="+", default=["VGG-Face", "Facenet", "ArcFace"])
+    args = parser.parse_args()
+
+    if args.real:
+        run_real(args)
+    else:
+        run_synthetic(args)
+
+
+if __name__ == "__main__":
+    main()
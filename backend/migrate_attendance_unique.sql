@@ -0,0 +1,44 @@
+-- =====================================================
+-- MIGRATE_ATTENDANCE_UNIQUE.SQL
+-- AI Attendance Tracker — one record per student, course and day
+-- Brings a database created before uq_attendance_daily in line with
+-- schemas.sql. Every attendance write upserts against this constraint
+-- (ON CONFLICT (student_id, course_id, date)) and fails without it.
+-- Requires PostgreSQL 15+ (NULLS NOT DISTINCT). Safe to run again.
+--
+--   psql -d <database> -f migrate_attendance_unique.sql
+--   python -m app.rebuild_rollups
+-- =====================================================
+
+BEGIN;
+
+-- Keep attendance writes out until the constraint is in place
+LOCK TABLE attendance IN SHARE ROW EXCLUSIVE MODE;
+
+-- =====================================================
+-- 1) REMOVE DUPLICATES
+-- Keep one record per student, course and day: an admin-verified one if
+-- any, otherwise the newest. PARTITION BY groups NULL courses together.
+-- =====================================================
+DELETE FROM attendance
+WHERE attendance_id IN (
+    SELECT attendance_id
+    FROM (
+        SELECT attendance_id,
+               ROW_NUMBER() OVER (
+                   PARTITION BY student_id, course_id, date
+                   ORDER BY verified_by_admin DESC NULLS LAST, attendance_id DESC
+               ) AS position
+        FROM attendance
+    ) ranked
+    WHERE position > 1
+);
+
+-- =====================================================
+-- 2) ADD THE CONSTRAINT
+-- =====================================================
+ALTER TABLE attendance DROP CONSTRAINT IF EXISTS uq_attendance_daily;
+ALTER TABLE attendance
+    ADD CONSTRAINT uq_attendance_daily UNIQUE NULLS NOT DISTINCT (student_id, course_id, date);
+
+COMMIT;
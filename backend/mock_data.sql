@@ -100,3 +100,6 @@ SELECT cs.id, s.id,
        'https://example.com/images/' || s.id || '.jpg'
 FROM class_session cs, student s
 WHERE random() < 0.1;
+
+-- Attendance rollups are not filled by these INSERTs; afterwards run:
+--   python -m app.rebuild_rollups
@@ -3,6 +3,11 @@
 -- ===============================================
 
 -- Drop tables if they already exist (for clean re-runs)
+DROP TABLE IF EXISTS attendance_faculty_weekly CASCADE;
+DROP TABLE IF EXISTS attendance_student_course CASCADE;
+DROP TABLE IF EXISTS attendance_course_daily CASCADE;
+DROP TABLE IF EXISTS face_images CASCADE;
+DROP TABLE IF EXISTS face_embeddings CASCADE;
 DROP TABLE IF EXISTS attendance_logs CASCADE;
 DROP TABLE IF EXISTS attendance CASCADE;
 DROP TABLE IF EXISTS student_course CASCADE;
@@ -80,7 +85,12 @@ CREATE TABLE attendance (
     time_in TIME,
     time_out TIME,
     status VARCHAR(20) CHECK (status IN ('Present', 'Absent', 'Late')),
-    recognized_face BOOLEAN DEFAULT FALSE
+    recognized_face BOOLEAN DEFAULT FALSE,
+    verified_by_admin BOOLEAN DEFAULT FALSE,
+    -- One record per student, course and day; writes upsert against it.
+    -- NULLS NOT DISTINCT (Postgres 15+) so records without a course cannot repeat either.
+    -- Existing databases: run migrate_attendance_unique.sql
+    CONSTRAINT uq_attendance_daily UNIQUE NULLS NOT DISTINCT (student_id, course_id, date)
 );
 
 -- ===============================================
@@ -96,6 +106,69 @@ CREATE TABLE attendance_logs (
     system_note TEXT
 );
 
+-- ===============================================
+-- Face Embeddings Table (computed once at registration)
+-- ===============================================
+CREATE TABLE face_embeddings (
+    embedding_id SERIAL PRIMARY KEY,
+    student_id INT NOT NULL REFERENCES students(student_id) ON DELETE CASCADE,
+    model_name VARCHAR(50) NOT NULL,
+    model_version VARCHAR(20) NOT NULL,
+    dimensions INT NOT NULL,
+    embedding BYTEA NOT NULL,
+    image_count INT DEFAULT 1,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_face_embedding_model UNIQUE (student_id, model_name, model_version)
+);
+
+-- ===============================================
+-- Face Images Table (reference crops per student, embedded per model)
+-- ===============================================
+CREATE TABLE face_images (
+    image_id SERIAL PRIMARY KEY,
+    student_id INT NOT NULL REFERENCES students(student_id) ON DELETE CASCADE,
+    content_hash VARCHAR(64) NOT NULL,
+    model_name VARCHAR(50) NOT NULL,
+    model_version VARCHAR(20) NOT NULL,
+    embedding BYTEA NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_face_image_model UNIQUE (student_id, content_hash, model_name, model_version)
+);
+
+-- ===============================================
+-- Attendance Rollups (updated with every attendance write;
+-- rebuild with: python -m app.rebuild_rollups)
+-- ===============================================
+CREATE TABLE attendance_course_daily (
+    course_id INT REFERENCES courses(course_id) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    total INT NOT NULL DEFAULT 0,
+    present INT NOT NULL DEFAULT 0,
+    late INT NOT NULL DEFAULT 0,
+    absent INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (course_id, date)
+);
+
+CREATE TABLE attendance_student_course (
+    student_id INT REFERENCES students(student_id) ON DELETE CASCADE,
+    course_id INT REFERENCES courses(course_id) ON DELETE CASCADE,
+    total INT NOT NULL DEFAULT 0,
+    present INT NOT NULL DEFAULT 0,
+    late INT NOT NULL DEFAULT 0,
+    absent INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (student_id, course_id)
+);
+
+CREATE TABLE attendance_faculty_weekly (
+    faculty_id INT REFERENCES faculties(faculty_id) ON DELETE CASCADE,
+    week_start DATE NOT NULL,  -- Monday
+    total INT NOT NULL DEFAULT 0,
+    present INT NOT NULL DEFAULT 0,
+    late INT NOT NULL DEFAULT 0,
+    absent INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (faculty_id, week_start)
+);
+
 -- ===============================================
 -- Indexes for faster queries
 -- ===============================================
@@ -103,6 +176,17 @@ CREATE INDEX idx_student_email ON students(email);
 CREATE INDEX idx_lecturer_email ON lecturers(email);
 CREATE INDEX idx_course_code ON courses(course_code);
 CREATE INDEX idx_attendance_date ON attendance(date);
+-- Per-course counts by date range can be answered from the index alone
+CREATE INDEX idx_attendance_course_date ON attendance(course_id, date) INCLUDE (status);
+-- A student's own records, paged in attendance_id order
+CREATE INDEX idx_attendance_student_page ON attendance(student_id, attendance_id);
+CREATE INDEX idx_course_faculty ON courses(faculty_id);
+CREATE INDEX idx_course_lecturer ON courses(lecturer_id);
+-- Rosters by course (student lookups use the UNIQUE(student_id, course_id) index)
+CREATE INDEX idx_student_course_course ON student_course(course_id);
+CREATE INDEX idx_face_images_student ON face_images(student_id);
+CREATE INDEX idx_face_images_model ON face_images(model_name, model_version);
+CREATE INDEX idx_rollup_student_course_course ON attendance_student_course(course_id);
 
 -- ===============================================
 -- Sample data (Optional for testing)
@@ -111,3 +111,6 @@ SELECT
     round((random() * 100)::NUMERIC, 2),
     'Auto-generated log entry for demo'
 FROM generate_series(1, 200) AS s(i);
+
+-- Attendance rollups are not filled by these INSERTs; afterwards run:
+--   python -m app.rebuild_rollups